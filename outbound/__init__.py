@@ -0,0 +1,150 @@
+#
+# Copyright © 2012 - 2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Shared client for outbound HTTP requests.
+
+- connections are pooled per host and reused
+- connect and read timeouts are always set
+- idempotent requests are retried on connection errors and 5xx responses
+- circuit breaker stops calling a failing host for a while
+- latency histogram is collected per host
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connect and read timeout
+DEFAULT_TIMEOUT = (5, 30)
+# Connections kept per host
+POOL_SIZE = 10
+RETRY = Retry(
+    total=2,
+    backoff_factor=0.5,
+    status_forcelist=(502, 503, 504),
+    raise_on_status=False,
+)
+# Consecutive failures to open the circuit
+BREAKER_THRESHOLD = 5
+# How long the circuit stays open
+BREAKER_TIMEOUT = 60
+# Latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LOCK = threading.Lock()
+SESSION = None
+BREAKERS = {}
+METRICS = {}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised when calling a host with open circuit."""
+
+
+def get_session():
+    """Return shared session with pooled connections."""
+    global SESSION  # pylint: disable=global-statement
+    with LOCK:
+        if SESSION is None:
+            SESSION = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=RETRY
+            )
+            SESSION.mount("http://", adapter)
+            SESSION.mount("https://", adapter)
+        return SESSION
+
+
+def check_circuit(host):
+    with LOCK:
+        breaker = BREAKERS.get(host)
+        if breaker is None or breaker["failures"] < BREAKER_THRESHOLD:
+            return
+        if breaker["opened"] + BREAKER_TIMEOUT > time.monotonic():
+            raise CircuitOpenError("Circuit open for {}".format(host))
+        # Half open, let single request through
+        breaker["opened"] = time.monotonic()
+
+
+def record_result(host, success, duration):
+    with LOCK:
+        breaker = BREAKERS.setdefault(host, {"failures": 0, "opened": 0})
+        if success:
+            breaker["failures"] = 0
+        else:
+            breaker["failures"] += 1
+            if breaker["failures"] >= BREAKER_THRESHOLD:
+                breaker["opened"] = time.monotonic()
+        metrics = METRICS.setdefault(
+            host,
+            {
+                "count": 0,
+                "errors": 0,
+                "total": 0.0,
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+            },
+        )
+        metrics["count"] += 1
+        metrics["total"] += duration
+        metrics["buckets"][bisect_left(LATENCY_BUCKETS, duration)] += 1
+        if not success:
+            metrics["errors"] += 1
+
+
+def get_metrics():
+    """Return latency histograms per host for this process."""
+    with LOCK:
+        return {
+            host: {
+                "count": metrics["count"],
+                "errors": metrics["errors"],
+                "total": metrics["total"],
+                "buckets": dict(
+                    zip(LATENCY_BUCKETS + (float("inf"),), metrics["buckets"])
+                ),
+            }
+            for host, metrics in METRICS.items()
+        }
+
+
+def request(method, url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Perform HTTP request using shared session."""
+    host = urlparse(url).netloc
+    check_circuit(host)
+    start = time.monotonic()
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+    except IOError:
+        record_result(host, False, time.monotonic() - start)
+        raise
+    record_result(host, response.status_code < 500, time.monotonic() - start)
+    return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
@@ -0,0 +1,48 @@
+#
+# Copyright © 2012 - 2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+import responses
+from django.test import SimpleTestCase
+
+import outbound
+
+
+class OutboundTest(SimpleTestCase):
+    @responses.activate
+    def test_metrics(self):
+        responses.add(responses.GET, "https://metrics.example.com/", body="")
+        outbound.get("https://metrics.example.com/")
+        metrics = outbound.get_metrics()["metrics.example.com"]
+        self.assertEqual(metrics["count"], 1)
+        self.assertEqual(metrics["errors"], 0)
+        self.assertEqual(sum(metrics["buckets"].values()), 1)
+
+    @responses.activate
+    def test_circuit_breaker(self):
+        url = "https://breaker.example.com/"
+        responses.add(responses.GET, url, status=500)
+        for _unused in range(outbound.BREAKER_THRESHOLD):
+            self.assertEqual(outbound.get(url).status_code, 500)
+        with self.assertRaises(outbound.CircuitOpenError):
+            outbound.get(url)
+        self.assertEqual(len(responses.calls), outbound.BREAKER_THRESHOLD)
+        # Let the circuit half open
+        outbound.BREAKERS["breaker.example.com"]["opened"] -= outbound.BREAKER_TIMEOUT
+        responses.replace(responses.GET, url, body="")
+        self.assertEqual(outbound.get(url).status_code, 200)
+        self.assertEqual(outbound.BREAKERS["breaker.example.com"]["failures"], 0)
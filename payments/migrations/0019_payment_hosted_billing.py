@@ -0,0 +1,20 @@
+# Generated by Django 3.1.2 on 2026-10-17 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0018_auto_20200821_1034"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="hosted_billing",
+            field=models.IntegerField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+    ]
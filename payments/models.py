@@ -32,6 +32,8 @@ from django.utils.translation import get_language, gettext_lazy, pgettext_lazy
 from django_countries.fields import CountryField
 from vies.models import VATINField
 
+import outbound
+
 from .data import SUPPORTED_LANGUAGES
 from .utils import JSONField, validate_email
 from .validators import validate_vatin
@@ -69,6 +71,9 @@ EU_VAT_RATES = {
 
 VAT_RATE = 21
 
+# Payment processing on the server can take long, wait for it
+TRIGGER_TIMEOUT = (5, 300)
+
 
 class Customer(models.Model):
     vat = VATINField(
@@ -215,6 +220,10 @@ class Payment(models.Model):
     amount_fixed = models.BooleanField(blank=True, default=False)
     start = models.DateField(blank=True, null=True)
     end = models.DateField(blank=True, null=True)
+    # Indexed copy of extra["billing"] used for hosted billing lookups
+    hosted_billing = models.IntegerField(
+        blank=True, null=True, db_index=True, editable=False
+    )
 
     class Meta:
         ordering = ["-created"]
@@ -224,6 +233,14 @@ class Payment(models.Model):
     def __str__(self):
         return "payment:{}".format(self.pk)
 
+    def save(
+        self, force_insert=False, force_update=False, using=None, update_fields=None
+    ):
+        self.hosted_billing = self.extra.get("billing")
+        if update_fields is not None and "extra" in update_fields:
+            update_fields = set(update_fields) | {"hosted_billing"}
+        super().save(force_insert, force_update, using, update_fields)
+
     def get_absolute_url(self):
         return reverse("payment", kwargs={"pk": self.pk})
 
@@ -319,11 +336,17 @@ class Payment(models.Model):
 
     def trigger_remotely(self):
         # Trigger payment processing remotely
-        requests.post(
-            self.get_payment_url(),
-            allow_redirects=False,
-            data={"method": self.backend, "secret": settings.PAYMENT_SECRET},
-        )
+        try:
+            outbound.post(
+                self.get_payment_url(),
+                allow_redirects=False,
+                data={"method": self.backend, "secret": settings.PAYMENT_SECRET},
+                timeout=TRIGGER_TIMEOUT,
+            )
+        except requests.ReadTimeout:
+            # The request was delivered, the processing continues on the
+            # server and the payment state is updated there
+            pass
 
 
 class PaymentConf(AppConf):
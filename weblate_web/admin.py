@@ -25,6 +25,7 @@ from weblate_web.models import (
     Package,
     PastPayments,
     Post,
+    ReportRollup,
     Service,
     Subscription,
 )
@@ -54,6 +55,7 @@ class ServiceAdmin(admin.ModelAdmin):
         "expires",
     ]
     list_filter = ("status",)
+    list_select_related = ("last_report",)
     search_fields = ("users__email", "report__site_url", "report__site_title")
     date_hierarchy = "created"
     filter_horizontal = ("users",)
@@ -101,6 +103,20 @@ class PastPaymentsAdmin(admin.ModelAdmin):
     list_display = ["subscription", "payment"]
 
 
+class ReportRollupAdmin(admin.ModelAdmin):
+    list_display = [
+        "service",
+        "period",
+        "start",
+        "reports",
+        "projects",
+        "languages",
+        "source_strings",
+    ]
+    list_filter = ("period",)
+    list_select_related = ("service__last_report",)
+
+
 admin.site.register(Image, ImageAdmin)
 admin.site.register(Post, PostAdmin)
 admin.site.register(Donation, DonationAdmin)
@@ -108,3 +124,4 @@ admin.site.register(Subscription, SubscriptionAdmin)
 admin.site.register(Service, ServiceAdmin)
 admin.site.register(Package, PackageAdmin)
 admin.site.register(PastPayments, PastPaymentsAdmin)
+admin.site.register(ReportRollup, ReportRollupAdmin)
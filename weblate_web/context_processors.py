@@ -17,26 +17,33 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
+from collections import Counter, defaultdict
+from functools import lru_cache
 from math import ceil
+from threading import Lock
 
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.urls import reverse
-from django.utils.functional import SimpleLazyObject
 from django.utils.translation import override
 
 from weblate_web.data import EXTENSIONS, VERSION
-from weblate_web.models import Donation
+from weblate_web.models import get_supporters
 from weblate_web.remote import get_activity, get_changes, get_contributors
 
+CONTEXT_USAGE = defaultdict(Counter)
+CONTEXT_USAGE_LOCK = Lock()
 
-def weblate_web(request):
-    if request.resolver_match and request.resolver_match.url_name:
-        match = request.resolver_match
-        url_name = ":".join(match.namespaces + [match.url_name])
-        url_kwargs = match.kwargs
-    else:
-        url_name = "home"
-        url_kwargs = {}
+
+@lru_cache(maxsize=1024)
+def get_language_urls(url_name, url_kwargs):
+    """Return canonical and per language URLs for given URL.
+
+    The result is cached in the process as it does not change during
+    runtime, url_kwargs has to be a tuple of the items to be hashable.
+    """
+    url_kwargs = dict(url_kwargs)
 
     # Get canonical URl, unfortunately there seems to be no clean
     # way, so just strip /en/ from the URL
@@ -57,20 +64,133 @@ def weblate_web(request):
                 }
             )
 
-    downloads = ["Weblate-{0}.{1}".format(VERSION, ext) for ext in EXTENSIONS]
     language_col = ceil(len(settings.LANGUAGES) / 3)
+    language_columns = [
+        language_urls[:language_col],
+        language_urls[language_col : language_col * 2],
+        language_urls[language_col * 2 :],
+    ]
+    return canonical_url, language_urls, language_columns
+
+
+@receiver(setting_changed)
+def reset_language_urls(*, setting, **kwargs):
+    if setting in ("ROOT_URLCONF", "LANGUAGES"):
+        get_language_urls.cache_clear()
+
+
+class LazyValue:
+    """Context value evaluated on first use in the template.
+
+    Django templates call callables when resolving variables, so the
+    value is computed only when template actually uses it. The usage is
+    recorded in CONTEXT_USAGE unless name is None.
+    """
+
+    def __init__(self, label, name, func, *args):
+        self.label = label
+        self.name = name
+        self.func = func
+        self.args = args
+        self.evaluated = False
+        self.value = None
+
+    def __call__(self):
+        if not self.evaluated:
+            self.value = self.func(*self.args)
+            self.evaluated = True
+            if self.name:
+                record_usage(self.label, self.name)
+        return self.value
+
+
+def get_template_label(request):
+    """Return template (or view) name used to render the request."""
+    match = request.resolver_match
+    if match is None:
+        return "unknown"
+    func = match.func
+    initkwargs = getattr(func, "view_initkwargs", {})
+    view_class = getattr(func, "view_class", None)
+    template = initkwargs.get("template_name") or getattr(
+        view_class, "template_name", None
+    )
+    return template or match.view_name
+
+
+def record_usage(label, name=None):
+    """Record context use, name None records the context creation."""
+    with CONTEXT_USAGE_LOCK:
+        CONTEXT_USAGE[label][name] += 1
+
+
+def get_context_usage():
+    """Return dict of templates with number of renders and used keys."""
+    with CONTEXT_USAGE_LOCK:
+        return {
+            label: {
+                "renders": usage[None],
+                "keys": {name: count for name, count in usage.items() if name},
+            }
+            for label, usage in CONTEXT_USAGE.items()
+        }
 
-    return {
-        "downloads": downloads,
-        "canonical_url": canonical_url,
-        "language_urls": language_urls,
-        "donate_links": Donation.objects.filter(active=True, reward=3),
-        "activity_sum": sum(get_activity()[-7:]),
-        "contributors": SimpleLazyObject(get_contributors),
-        "changes": SimpleLazyObject(get_changes),
-        "language_columns": [
-            language_urls[:language_col],
-            language_urls[language_col : language_col * 2],
-            language_urls[language_col * 2 :],
-        ],
+
+def get_urls(request):
+    if request.resolver_match and request.resolver_match.url_name:
+        match = request.resolver_match
+        url_name = ":".join(match.namespaces + [match.url_name])
+        url_kwargs = tuple(sorted(match.kwargs.items()))
+    else:
+        url_name = "home"
+        url_kwargs = ()
+
+    try:
+        return get_language_urls(url_name, url_kwargs)
+    except TypeError:
+        # Unhashable kwargs (for example sitemaps passed as extra arguments)
+        return get_language_urls.__wrapped__(url_name, url_kwargs)
+
+
+def get_downloads():
+    return ["Weblate-{0}.{1}".format(VERSION, ext) for ext in EXTENSIONS]
+
+
+def get_activity_sum():
+    return sum(get_activity()[-7:])
+
+
+def get_context(request):
+    label = get_template_label(request)
+    record_usage(label)
+    urls = LazyValue(label, None, get_urls, request)
+
+    result = {
+        "downloads": get_downloads,
+        "canonical_url": lambda: urls()[0],
+        "language_urls": lambda: urls()[1],
+        "language_columns": lambda: urls()[2],
+        "supporters": get_supporters,
+        "activity_sum": get_activity_sum,
+        "contributors": get_contributors,
+        "changes": get_changes,
     }
+    return {name: LazyValue(label, name, value) for name, value in result.items()}
+
+
+def weblate_web(request):
+    context = get_context(request)
+    # Used by the page cache to know which values the page needs
+    request.weblate_context = context
+    return context
+
+
+def replay_context(request, names):
+    """Evaluate context values used by a page served from the cache.
+
+    This triggers refresh of stale remote data and records the usage
+    same as rendering the page would.
+    """
+    context = get_context(request)
+    for name in names:
+        context[name]()
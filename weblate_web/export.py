@@ -0,0 +1,317 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Static export of the website.
+
+Every page is rendered to a file named by hash of its content, the
+URL path then contains index.html (and precompressed siblings) symlinks
+to it so that web server can serve it directly. The manifest keeps
+fingerprint of inputs of every page, so that only pages with changed
+inputs are rendered again.
+"""
+
+import gzip
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.template import engines
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import override, to_locale
+
+from weblate_web.data import VERSION
+from weblate_web.models import Post, RemoteData, get_supporters
+from weblate_web.pagecache import is_cacheable_response
+from weblate_web.sitemaps import PagesSitemap
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+HANDLER = None
+
+
+def get_digest(*items):
+    return sha256(
+        json.dumps(items, cls=DjangoJSONEncoder, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def get_tree_digest(paths, suffix=""):
+    """Digest of files in the directories based on their stat."""
+    result = []
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith(suffix):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                result.append((root, name, stat.st_size, stat.st_mtime_ns))
+    return get_digest(result)
+
+
+def get_templates_digest():
+    dirs = []
+    for engine in engines.all():
+        dirs.extend(engine.template_dirs)
+    return get_tree_digest(dirs)
+
+
+def get_translations_digest(language):
+    locale = to_locale(language)
+    return get_tree_digest(
+        [os.path.join(path, locale) for path in settings.LOCALE_PATHS], ".mo"
+    )
+
+
+def get_remote_digest():
+    return get_digest(
+        list(RemoteData.objects.order_by("key").values_list("key", "data")),
+        get_supporters(),
+    )
+
+
+def get_post_digest(post):
+    return get_digest(
+        post.pk,
+        post.slug,
+        post.title,
+        post.body.raw,
+        post.summary,
+        post.timestamp,
+        post.topic,
+        post.image_id,
+        post.milestone,
+        post.author_id,
+    )
+
+
+def get_pages():
+    """Return list of URL paths and fingerprints of their inputs."""
+    templates = get_templates_digest()
+    remote = get_remote_digest()
+    posts = Post.objects.filter(timestamp__lt=timezone.now()).order_by("-timestamp")
+    post_digests = {post.pk: get_post_digest(post) for post in posts}
+    all_posts = get_digest(sorted(post_digests.values()))
+
+    result = []
+    for language, _name in settings.LANGUAGES:
+        base = (VERSION, templates, get_translations_digest(language))
+        sitemap = PagesSitemap(language)
+        for item in sitemap.items():
+            url = sitemap.location(item)
+            if item[0] == "/news/":
+                result.append((url, get_digest(base, url, all_posts)))
+            else:
+                result.append((url, get_digest(base, url, remote)))
+        with override(language):
+            for post in posts:
+                url = reverse("post", kwargs={"slug": post.slug})
+                # Post page shows published posts from its related set
+                related = [(pk, post_digests.get(pk)) for pk in post.related]
+                result.append(
+                    (url, get_digest(base, url, post_digests[post.pk], related))
+                )
+    return result
+
+
+def compress_gzip(content):
+    # Fixed mtime makes the output reproducible
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=9, mtime=0) as handle:
+        handle.write(content)
+    return buffer.getvalue()
+
+
+def write_atomic(filename, content):
+    temp = "{}.tmp".format(filename)
+    with open(temp, "wb") as handle:
+        handle.write(content)
+    os.replace(temp, filename)
+
+
+def symlink_atomic(target, filename):
+    temp = "{}.tmp".format(filename)
+    if os.path.lexists(temp):
+        os.unlink(temp)
+    os.symlink(target, temp)
+    os.replace(temp, filename)
+
+
+def get_handler():
+    global HANDLER
+    if HANDLER is None:
+        host = settings.ALLOWED_HOSTS[0].lstrip(".")
+        if host == "*":
+            host = "localhost"
+        HANDLER = (WSGIHandler(), RequestFactory(HTTP_HOST=host))
+    return HANDLER
+
+
+def get_response(url):
+    """Render the URL through the project middleware and views.
+
+    Returns the request together with the response, exceptions are
+    converted to error responses the same way as for served requests.
+    """
+    handler, factory = get_handler()
+    request = factory.get(url)
+    return request, handler.get_response(request)
+
+
+def init_worker():
+    django.setup()
+
+
+def render_page(output, url):
+    """Render single page and write it to the output.
+
+    Returns dictionary with page information for the manifest or None
+    if the page can not be exported, for example when it includes CSRF
+    token which is specific to the user.
+    """
+    request, response = get_response(url)
+    if not is_cacheable_response(request, response):
+        return None
+    if not response["Content-Type"].startswith("text/html"):
+        return None
+    content = response.content
+    digest = sha256(content).hexdigest()
+    dirname = url.strip("/")
+    name = "index.{}.html".format(digest[:12])
+    target = os.path.join(output, dirname)
+    os.makedirs(target, exist_ok=True)
+
+    variants = [("", None, content), (".gz", "gzip", compress_gzip(content))]
+    if brotli is not None:
+        variants.append((".br", "br", brotli.compress(content)))
+    for suffix, _encoding, data in variants:
+        filename = os.path.join(target, name + suffix)
+        if not os.path.exists(filename):
+            write_atomic(filename, data)
+        symlink_atomic(name + suffix, os.path.join(target, "index.html" + suffix))
+
+    return {
+        "file": os.path.join(dirname, name),
+        "sha256": digest,
+        "size": len(content),
+        "encodings": [encoding for _suffix, encoding, _data in variants if encoding],
+    }
+
+
+def render_task(task):
+    output, url, fingerprint = task
+    result = render_page(output, url)
+    if result is not None:
+        result["fingerprint"] = fingerprint
+    return url, result
+
+
+def load_manifest(output):
+    try:
+        with open(os.path.join(output, MANIFEST)) as handle:
+            manifest = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest["pages"]
+
+
+def remove_page(output, page):
+    """Remove files of page which is no longer current."""
+    filename = os.path.join(output, page["file"])
+    for suffix in ("", ".gz", ".br"):
+        if os.path.lexists(filename + suffix):
+            os.unlink(filename + suffix)
+
+
+def export_site(output, jobs=1, force=False):
+    """Export the website to the output directory.
+
+    Returns tuple with number of rendered, unchanged and removed pages and
+    list of URLs which could not be exported.
+    """
+    previous = load_manifest(output)
+    pages = {}
+    tasks = []
+    unchanged = 0
+    for url, fingerprint in get_pages():
+        page = previous.get(url)
+        if (
+            not force
+            and page
+            and page["fingerprint"] == fingerprint
+            and os.path.exists(os.path.join(output, page["file"]))
+        ):
+            pages[url] = page
+            unchanged += 1
+        else:
+            tasks.append((output, url, fingerprint))
+
+    if jobs > 1 and tasks:
+        # Child processes have to open own database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as pool:
+            results = list(pool.map(render_task, tasks, chunksize=8))
+    else:
+        results = [render_task(task) for task in tasks]
+
+    rendered = 0
+    skipped = []
+    for url, result in results:
+        if result is None:
+            skipped.append(url)
+        else:
+            pages[url] = result
+            rendered += 1
+
+    removed = 0
+    for url, page in previous.items():
+        current = pages.get(url)
+        if current is None or current["file"] != page["file"]:
+            remove_page(output, page)
+        if current is None:
+            removed += 1
+            dirname = os.path.join(output, url.strip("/"))
+            for suffix in ("", ".gz", ".br"):
+                link = os.path.join(dirname, "index.html" + suffix)
+                if os.path.lexists(link):
+                    os.unlink(link)
+
+    write_atomic(
+        os.path.join(output, MANIFEST),
+        json.dumps(
+            {"version": MANIFEST_VERSION, "pages": pages}, indent=2, sort_keys=True
+        ).encode(),
+    )
+    return rendered, unchanged, removed, skipped
@@ -0,0 +1,53 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Leases stored in the cache.
+
+Lease ensures that only one process in the cluster performs given work at
+time. It expires on its own, so crashed process does not block the work.
+"""
+
+from uuid import uuid4
+
+from django.core.cache import cache
+
+# Maximal duration of the lease
+LEASE_TIMEOUT = 120
+
+
+def get_lease_key(key):
+    return "{}-lease".format(key)
+
+
+def acquire_lease(key):
+    """Acquire lease for the key, returns token on success."""
+    token = uuid4().hex
+    if cache.add(get_lease_key(key), token, timeout=LEASE_TIMEOUT):
+        return token
+    return None
+
+
+def release_lease(key, token):
+    name = get_lease_key(key)
+    # Do not remove lease acquired by other process after expiry
+    if cache.get(name) == token:
+        cache.delete(name)
+
+
+def is_leased(key):
+    return cache.get(get_lease_key(key)) is not None
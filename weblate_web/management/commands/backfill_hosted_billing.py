@@ -0,0 +1,47 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from payments.models import Payment
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "fills in hosted billing of existing payments"
+
+    def handle(self, *args, **options):
+        changed = []
+        updated = 0
+        for payment in Payment.objects.only(
+            "uuid", "extra", "hosted_billing"
+        ).iterator():
+            billing = payment.extra.get("billing")
+            if billing != payment.hosted_billing:
+                payment.hosted_billing = billing
+                changed.append(payment)
+            if len(changed) >= BATCH_SIZE:
+                Payment.objects.bulk_update(changed, ["hosted_billing"])
+                updated += len(changed)
+                changed = []
+        if changed:
+            Payment.objects.bulk_update(changed, ["hosted_billing"])
+            updated += len(changed)
+        self.stdout.write("Updated hosted billing for {} payments".format(updated))
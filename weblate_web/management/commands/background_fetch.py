@@ -17,15 +17,74 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
-from django.core.management.base import BaseCommand
+import time
+from concurrent.futures import wait
 
-from weblate_web.remote import get_activity, get_changes, get_contributors
+from django.core.management.base import BaseCommand, CommandError
+
+from weblate_web.remote import REMOTE_DATA, REMOTE_TIMEOUT
+from weblate_web.scheduler import Scheduler, get_jobs, get_status
 
 
 class Command(BaseCommand):
-    help = "refreshes remote data"
+    help = "refreshes remote data and stores queued reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--daemon",
+            action="store_true",
+            help="Keep running and refresh the data periodically",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=REMOTE_TIMEOUT // 2,
+            help="Refresh interval in seconds for daemon mode",
+        )
+        parser.add_argument(
+            "--status",
+            action="store_true",
+            help="Show status of the background refresh",
+        )
 
     def handle(self, *args, **options):
-        get_contributors(True)
-        get_activity(True)
-        get_changes(True)
+        if options["status"]:
+            self.show_status()
+            return
+        scheduler = Scheduler(get_jobs(options["interval"]))
+        if options["daemon"]:
+            try:
+                scheduler.run_forever()
+            except KeyboardInterrupt:
+                return
+        else:
+            wait(scheduler.run_pending())
+            scheduler.executor.shutdown()
+
+    def show_status(self):
+        status = get_status()
+        stale = []
+        now = time.time()
+        for name in REMOTE_DATA:
+            job = status.get(name, {})
+            last_success = job.get("last_success")
+            if last_success is None:
+                age = "never"
+            else:
+                age = "{:.0f}s ago".format(now - last_success)
+            self.stdout.write(
+                "{}: last success {}, failures {}{}".format(
+                    name,
+                    age,
+                    job.get("failures", 0),
+                    (
+                        ", error: {}".format(job["last_error"])
+                        if job.get("last_error")
+                        else ""
+                    ),
+                )
+            )
+            if last_success is None or now - last_success > 2 * REMOTE_TIMEOUT:
+                stale.append(name)
+        if stale:
+            raise CommandError("Stale remote data: {}".format(", ".join(stale)))
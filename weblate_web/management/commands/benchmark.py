@@ -0,0 +1,228 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import random
+from collections import Counter
+from io import StringIO
+from itertools import accumulate
+from timeit import Timer
+from uuid import uuid4
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import override_settings
+from django.urls import resolve, reverse
+from django.utils.translation import override
+from lxml import etree
+
+from weblate_web.context_processors import get_language_urls, weblate_web
+from weblate_web.middleware import SecurityMiddleware
+from weblate_web.search import SearchIndex, get_top, tokenize
+from weblate_web.templatetags.site_url import add_site_url, rewrite_links
+
+BENCHMARKS = {}
+
+MAILS = (
+    "expiring_subscriptions",
+    "new_subscription",
+    "payment_completed",
+    "payment_expired",
+    "payment_failed",
+    "payment_pending",
+)
+
+SEARCH_POSTS = 100000
+SEARCH_WORDS = 20000
+SEARCH_LENGTH = 40
+
+
+def benchmark(name):
+    """Register benchmark, it yields pairs of label and callable."""
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+@benchmark("context")
+def benchmark_context():
+    with override("en"):
+        request = RequestFactory().get(reverse("features"))
+        request.resolver_match = resolve(request.path)
+
+    def evaluate():
+        return {name: value() for name, value in weblate_web(request).items()}
+
+    def uncached():
+        get_language_urls.cache_clear()
+        evaluate()
+
+    yield "lazy", lambda: weblate_web(request)
+    yield "evaluated without URL cache", uncached
+    yield "evaluated with URL cache", evaluate
+
+
+@benchmark("middleware")
+def benchmark_middleware():
+    factory = RequestFactory()
+    middleware = SecurityMiddleware(lambda request: HttpResponse())
+    upload = encode_multipart(
+        BOUNDARY,
+        {"link_image": SimpleUploadedFile("logo.png", b"x" * 1000000)},
+    )
+    payment = "/en/payment/{}/".format(uuid4())
+
+    def get():
+        return factory.get("/en/features/")
+
+    def post_upload():
+        return factory.generic(
+            "POST", "/en/donate/edit/1/", upload, content_type=MULTIPART_CONTENT
+        )
+
+    def post_payment():
+        return factory.post(payment, {"secret": "invalid"})
+
+    with override_settings(DEBUG=False):
+        for label, request in (
+            ("GET", get),
+            ("POST upload", post_upload),
+            ("POST payment", post_payment),
+        ):
+            yield "{} request only".format(label), request
+            yield "{} with middleware".format(
+                label
+            ), lambda request=request: middleware(request())
+
+
+def add_site_url_lxml(content):
+    """Previous implementation of add_site_url, used for comparison."""
+    parser = etree.HTMLParser()
+    tree = etree.parse(StringIO(content), parser)
+    for link in tree.findall("//a"):
+        url = link.get("href")
+        if url and url.startswith("/"):
+            link.set("href", "https://weblate.org" + url)
+    for link in tree.findall("//img"):
+        url = link.get("src")
+        if url and url.startswith("/"):
+            link.set("src", "https://weblate.org" + url)
+    return etree.tostring(
+        tree.getroot(), pretty_print=True, method="html", encoding="unicode"
+    )
+
+
+@benchmark("site_url")
+def benchmark_site_url():
+    mails = [
+        render_to_string(
+            "mail/{}.html".format(name),
+            {
+                "subject": name,
+                "request": True,
+                "payment": {
+                    "vat_amount": 100,
+                    "customer": {"needs_vat": True},
+                    "details": {"reject_reason": "Card declined"},
+                },
+                "backend": {"get_instructions": [("Account", "123456789/2010")]},
+                "expiry": [("Service", ["noreply@example.com"])],
+            },
+        )
+        for name in MAILS
+    ]
+
+    def uncached():
+        for mail in mails:
+            rewrite_links(mail)
+
+    def cached():
+        for mail in mails:
+            add_site_url(mail)
+
+    yield "lxml", lambda: [add_site_url_lxml(mail) for mail in mails]
+    yield "rewriter", uncached
+    yield "rewriter cached", cached
+
+
+@benchmark("search")
+def benchmark_search():
+    # Synthetic corpus with Zipf distribution of words
+    generator = random.Random(42)
+    words = ["word{}".format(i) for i in range(SEARCH_WORDS)]
+    weights = list(accumulate(1 / (i + 1) for i in range(SEARCH_WORDS)))
+    index = SearchIndex()
+    for key in range(SEARCH_POSTS):
+        terms = Counter(generator.choices(words, cum_weights=weights, k=SEARCH_LENGTH))
+        index.add(key, terms, key)
+    update = Counter(generator.choices(words, cum_weights=weights, k=SEARCH_LENGTH))
+
+    def add_post():
+        index.add(SEARCH_POSTS, update, SEARCH_POSTS)
+
+    def search(query):
+        # Scores all matches and orders the first page
+        return get_top(index.search(tokenize(query)), 10)
+
+    def search_updated(query):
+        # First search after the index has changed
+        add_post()
+        return search(query)
+
+    yield "common term", lambda: search("word0")
+    yield "rare term", lambda: search("word15000")
+    yield "phrase", lambda: search("word3 word42 word500 word9999")
+    yield "update", add_post
+    yield "updated common term", lambda: search_updated("word0")
+    yield "updated phrase", lambda: search_updated("word3 word42 word500 word9999")
+
+
+class Command(BaseCommand):
+    help = "measures cost of performance sensitive code"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "benchmarks",
+            nargs="*",
+            help="Benchmarks to run ({})".format(", ".join(sorted(BENCHMARKS))),
+        )
+        parser.add_argument(
+            "--number", type=int, default=1000, help="Number of iterations"
+        )
+
+    def handle(self, *args, **options):
+        names = options["benchmarks"] or sorted(BENCHMARKS)
+        for name in names:
+            if name not in BENCHMARKS:
+                raise CommandError("Unknown benchmark: {}".format(name))
+            for label, func in BENCHMARKS[name]():
+                # Warm up
+                func()
+                duration = Timer(func).timeit(options["number"])
+                self.stdout.write(
+                    "{}: {}: {:.1f} µs per call".format(
+                        name, label, duration * 1000000 / options["number"]
+                    )
+                )
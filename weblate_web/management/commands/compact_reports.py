@@ -0,0 +1,54 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from weblate_web.reports import BATCH_SIZE, compact_reports, compact_rollups
+
+
+class Command(BaseCommand):
+    help = "compacts old reports into daily and monthly rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of rows processed in single transaction",
+        )
+        parser.add_argument(
+            "--batches",
+            type=int,
+            default=0,
+            help="Maximal number of batches for each step, 0 for no limit",
+        )
+
+    def handle(self, *args, **options):
+        for name, func in (
+            ("reports", compact_reports),
+            ("daily rollups", compact_rollups),
+        ):
+            total = batches = 0
+            while not options["batches"] or batches < options["batches"]:
+                count = func(batch_size=options["batch_size"])
+                if not count:
+                    break
+                total += count
+                batches += 1
+            self.stdout.write("Compacted {} {}".format(total, name))
@@ -0,0 +1,61 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from weblate_web.context_processors import get_context_usage
+from weblate_web.export import get_response
+from weblate_web.sitemaps import PagesSitemap
+
+EXTRA_PATHS = (
+    "/en/about/",
+    "/img/activity.svg",
+    "/site.webmanifest",
+    "/.well-known/security.txt",
+)
+
+
+class Command(BaseCommand):
+    help = "reports template context keys used by rendered pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="*", help="Paths to render, defaults to all pages"
+        )
+
+    def handle(self, *args, **options):
+        paths = options["paths"]
+        if not paths:
+            sitemap = PagesSitemap("en")
+            paths = [sitemap.location(item) for item in sitemap.items()]
+            paths.extend(EXTRA_PATHS)
+
+        for path in paths:
+            _request, response = get_response(path)
+            if response.status_code != 200:
+                self.stderr.write("{}: HTTP {}".format(path, response.status_code))
+
+        for label, usage in sorted(get_context_usage().items()):
+            keys = ", ".join(
+                "{} ({})".format(name, count)
+                for name, count in sorted(usage["keys"].items())
+            )
+            self.stdout.write(
+                "{} [{} renders]: {}".format(label, usage["renders"], keys or "-")
+            )
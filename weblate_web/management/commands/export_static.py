@@ -0,0 +1,57 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from weblate_web.export import brotli, export_site
+
+
+class Command(BaseCommand):
+    help = "exports static pages in all languages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Output directory")
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of rendering processes",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Render all pages regardless of their inputs",
+        )
+
+    def handle(self, *args, **options):
+        if brotli is None:
+            self.stderr.write("brotli module not available, skipping .br files")
+        os.makedirs(options["output"], exist_ok=True)
+        rendered, unchanged, removed, skipped = export_site(
+            options["output"], jobs=options["jobs"], force=options["force"]
+        )
+        for url in skipped:
+            self.stderr.write("{}: not exported".format(url))
+        self.stdout.write(
+            "Rendered {} pages, {} unchanged, {} removed".format(
+                rendered, unchanged, removed
+            )
+        )
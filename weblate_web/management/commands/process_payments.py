@@ -27,6 +27,7 @@ from payments.models import Payment
 from weblate_web.models import (
     PAYMENTS_ORIGIN,
     Donation,
+    invalidate_supporters,
     process_donation,
     process_subscription,
 )
@@ -65,6 +66,8 @@ class Command(BaseCommand):
     @staticmethod
     def active():
         # Adjust active flag
-        Donation.objects.filter(active=True, expires__lt=timezone.now()).update(
-            active=False
-        )
+        expired = Donation.objects.filter(
+            active=True, expires__lt=timezone.now()
+        ).update(active=False)
+        if expired:
+            invalidate_supporters()
@@ -25,7 +25,13 @@ from django.utils import timezone
 
 from payments.models import Payment
 from payments.utils import send_notification
-from weblate_web.models import Donation, Service, Subscription
+from weblate_web.models import (
+    Donation,
+    Package,
+    Service,
+    Subscription,
+    load_subscription_states,
+)
 
 
 class Command(BaseCommand):
@@ -79,8 +85,11 @@ class Command(BaseCommand):
 
     @staticmethod
     def handle_services():
-        for service in Service.objects.all():
-            service.update_status()
+        packages = {package.name: package for package in Package.objects.all()}
+        services = list(Service.objects.select_related("last_report"))
+        load_subscription_states(services, Subscription.objects.all())
+        for service in services:
+            service.update_status(packages)
             service.create_backup()
 
     @staticmethod
@@ -0,0 +1,37 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from weblate_web.releases import generate_manifest, get_manifest_path
+
+
+class Command(BaseCommand):
+    help = "updates manifest of released files"
+
+    def handle(self, *args, **options):
+        manifest = generate_manifest()
+        for name, info in sorted(manifest["files"].items()):
+            if info is None:
+                self.stderr.write("{}: missing".format(name))
+            else:
+                self.stdout.write(
+                    "{}: {} bytes, sha256 {}".format(name, info["size"], info["sha256"])
+                )
+        self.stdout.write("Written {}".format(get_manifest_path()))
@@ -0,0 +1,38 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from weblate_web.sitemaps import write_sitemaps
+
+
+class Command(BaseCommand):
+    help = "writes sitemaps to static files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=settings.SITEMAP_PATH,
+            help="Output directory, defaults to SITEMAP_PATH setting",
+        )
+
+    def handle(self, *args, **options):
+        files = write_sitemaps(options["output"])
+        self.stdout.write("Written {} sitemap files".format(len(files)))
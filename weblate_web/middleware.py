@@ -17,7 +17,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from functools import partial
+
 from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
 
 URL = (
     "https://sentry.io/api/1305560/security/"
@@ -37,6 +42,64 @@ CSP_TEMPLATE = (
     "report-uri {report}"
 )
 
+# URLs accepting payment secret instead of CSRF token
+SECRET_URLS = {"payment"}
+
+
+def get_csp():
+    style = ["'self'", "s.weblate.org"]
+    script = ["'self'"]
+    connect = ["'self'"]
+    image = ["'self'", "data:"]
+    font = ["'self'", "s.weblate.org"]
+
+    # Sentry/Raven
+    script.append("cdn.ravenjs.com")
+
+    # Matomo/Piwik
+    script.append("stats.cihar.com")
+    image.append("stats.cihar.com")
+    connect.append("stats.cihar.com")
+
+    # Hosted Weblate widget
+    image.append("hosted.weblate.org")
+
+    # Old blog entries
+    image.append("blog.cihar.com")
+
+    # The Pay
+    image.append("www.thepay.cz")
+
+    # GitHub avatars
+    image.append("*.githubusercontent.com")
+
+    return CSP_TEMPLATE.format(
+        style=" ".join(style),
+        image=" ".join(image),
+        script=" ".join(script),
+        font=" ".join(font),
+        connect=" ".join(connect),
+        report=URL,
+    )
+
+
+CSP = get_csp()
+EXPECT_CT = 'max-age=86400, enforce, report-uri="{}"'.format(URL)
+
+
+def is_secret_url(request):
+    try:
+        match = resolve(request.path_info, getattr(request, "urlconf", None))
+    except Resolver404:
+        return False
+    return match.url_name in SECRET_URLS
+
+
+def has_payment_secret(request):
+    return constant_time_compare(
+        request.POST.get("secret", ""), settings.PAYMENT_SECRET
+    )
+
 
 class SecurityMiddleware:
     """Middleware that sets various security related headers.
@@ -51,49 +114,23 @@ class SecurityMiddleware:
 
     def __call__(self, request):
         # Skip CSRF validation for requests with valid secret
-        # This is used to process automatic payments
-        if request.POST.get("secret") == settings.PAYMENT_SECRET:
-            request._dont_enforce_csrf_checks = True  # noqa: SF01
+        # This is used to process automatic payments. The body is parsed
+        # only when the CSRF check is actually performed.
+        if (
+            request.method == "POST"
+            and not getattr(request, "_dont_enforce_csrf_checks", False)
+            and is_secret_url(request)
+        ):
+            request._dont_enforce_csrf_checks = SimpleLazyObject(  # noqa: SF01
+                partial(has_payment_secret, request)
+            )
 
         response = self.get_response(request)
         # No CSP for debug mode (to allow djdt or error pages)
         if settings.DEBUG:
             return response
 
-        style = ["'self'", "s.weblate.org"]
-        script = ["'self'"]
-        connect = ["'self'"]
-        image = ["'self'", "data:"]
-        font = ["'self'", "s.weblate.org"]
-
-        # Sentry/Raven
-        script.append("cdn.ravenjs.com")
-
-        # Matomo/Piwik
-        script.append("stats.cihar.com")
-        image.append("stats.cihar.com")
-        connect.append("stats.cihar.com")
-
-        # Hosted Weblate widget
-        image.append("hosted.weblate.org")
-
-        # Old blog entries
-        image.append("blog.cihar.com")
-
-        # The Pay
-        image.append("www.thepay.cz")
-
-        # GitHub avatars
-        image.append("*.githubusercontent.com")
-
-        response["Content-Security-Policy"] = CSP_TEMPLATE.format(
-            style=" ".join(style),
-            image=" ".join(image),
-            script=" ".join(script),
-            font=" ".join(font),
-            connect=" ".join(connect),
-            report=URL,
-        )
-        response["Expect-CT"] = 'max-age=86400, enforce, report-uri="{}"'.format(URL)
+        response["Content-Security-Policy"] = CSP
+        response["Expect-CT"] = EXPECT_CT
         response["X-XSS-Protection"] = "1; mode=block"
         return response
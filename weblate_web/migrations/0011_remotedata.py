@@ -0,0 +1,40 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:48
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weblate_web", "0010_auto_20200819_1135"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RemoteData",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=100, unique=True)),
+                (
+                    "data",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Remote data",
+                "verbose_name_plural": "Remote data",
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.2 on 2026-10-17 04:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weblate_web", "0011_remotedata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="modified",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
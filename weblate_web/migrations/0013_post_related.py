@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-17 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weblate_web", "0012_post_modified"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="related",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
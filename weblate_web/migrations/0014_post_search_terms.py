@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-17 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weblate_web", "0013_post_related"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="search_terms",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
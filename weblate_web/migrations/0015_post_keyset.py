@@ -0,0 +1,17 @@
+# Generated by Django 3.1.2 on 2026-10-17 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weblate_web", "0014_post_search_terms"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["timestamp", "id"], name="post_keyset"),
+        ),
+    ]
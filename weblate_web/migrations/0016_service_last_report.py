@@ -0,0 +1,42 @@
+# Generated by Django 3.1.2 on 2026-10-17 04:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_last_report(apps, schema_editor):
+    Service = apps.get_model("weblate_web", "Service")
+    Report = apps.get_model("weblate_web", "Report")
+    Service.objects.using(schema_editor.connection.alias).update(
+        last_report=Subquery(
+            Report.objects.filter(service=OuterRef("pk"))
+            .order_by("-timestamp")
+            .values("pk")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weblate_web", "0015_post_keyset"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="service",
+            name="last_report",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="weblate_web.report",
+            ),
+        ),
+        migrations.RunPython(
+            fill_last_report, migrations.RunPython.noop, elidable=True
+        ),
+    ]
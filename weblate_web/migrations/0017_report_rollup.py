@@ -0,0 +1,58 @@
+# Generated by Django 3.1.2 on 2026-10-17 04:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weblate_web", "0016_service_last_report"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="report",
+            name="timestamp",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name="ReportRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("d", "Daily"), ("m", "Monthly")], max_length=1
+                    ),
+                ),
+                ("start", models.DateField()),
+                ("reports", models.IntegerField(default=0)),
+                ("users", models.IntegerField(default=0)),
+                ("projects", models.IntegerField(default=0)),
+                ("components", models.IntegerField(default=0)),
+                ("languages", models.IntegerField(default=0)),
+                ("source_strings", models.IntegerField(default=0)),
+                (
+                    "service",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="weblate_web.service",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Weblate report rollup",
+                "verbose_name_plural": "Weblate report rollups",
+                "unique_together": {("service", "period", "start")},
+            },
+        ),
+    ]
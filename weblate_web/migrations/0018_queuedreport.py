@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-17 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weblate_web", "0017_report_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedReport",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("service", models.IntegerField()),
+                ("values", models.JSONField()),
+            ],
+            options={
+                "verbose_name": "Queued Weblate report",
+                "verbose_name_plural": "Queued Weblate reports",
+            },
+        ),
+    ]
@@ -17,14 +17,20 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
+from collections import defaultdict
+from hashlib import md5
+from math import ceil
 from uuid import uuid4
 
 import html2text
-import requests
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
@@ -34,11 +40,20 @@ from django.utils.translation import override, ugettext_lazy
 from markupfield.fields import MarkupField
 from paramiko.client import SSHClient
 
+import outbound
 from payments.models import Payment, get_period_delta
 from payments.utils import send_notification
+from weblate_web.pagecache import bump_content_version
 
 PAYMENTS_ORIGIN = "https://weblate.org/donate/process/"
 
+SUPPORTERS_CACHE_KEY = "wlweb-supporters"
+
+NEWS_VERSION_KEY = "wlweb-news-version"
+# Set when related posts need to be recomputed
+RELATED_CHANGED_KEY = "wlweb-related-changed"
+NEWS_VERSION_TIMEOUT = 3600
+
 REWARDS = (
     (0, ugettext_lazy("No reward")),
     (1, ugettext_lazy("Name in the list of supporters")),
@@ -58,6 +73,26 @@ TOPICS = (
 
 TOPIC_DICT = dict(TOPICS)
 
+REPORT_FIELDS = (
+    "site_url",
+    "site_title",
+    "version",
+    "ssh_key",
+    "users",
+    "projects",
+    "components",
+    "languages",
+    "source_strings",
+)
+
+LIMIT_FIELDS = ("projects", "languages", "source_strings")
+
+SERVICE_STATUS_KEY = "wlweb-service-status"
+SERVICE_STATUS_TIMEOUT = 3600
+
+# Support offerings ordered by priority
+SUPPORT_STATUSES = ("hosted", "shared", "premium", "extended", "basic")
+
 
 def create_backup_repository(service):
     """
@@ -84,7 +119,7 @@ def create_backup_repository(service):
     url = "https://robot-ws.your-server.de/storagebox/{}/subaccount".format(
         settings.STORAGE_BOX
     )
-    response = requests.post(
+    response = outbound.post(
         url,
         data={
             "homedirectory": "weblate/{}".format(dirname),
@@ -165,6 +200,39 @@ class Donation(models.Model):
             )
 
 
+def get_supporters():
+    """Return serialized list of supporters shown on the website.
+
+    The list is cached and invalidated whenever donation changes, so
+    rendering it does not need any database or storage access.
+    """
+    supporters = cache.get(SUPPORTERS_CACHE_KEY)
+    if supporters is None:
+        supporters = []
+        for donation in Donation.objects.filter(active=True, reward=3).order_by("pk"):
+            supporter = {
+                "url": donation.link_url,
+                "text": donation.link_text,
+                "image": None,
+            }
+            if donation.link_image:
+                supporter["image"] = donation.link_image.url
+            supporters.append(supporter)
+        cache.set(SUPPORTERS_CACHE_KEY, supporters, None)
+    return supporters
+
+
+def invalidate_supporters():
+    cache.delete(SUPPORTERS_CACHE_KEY)
+    bump_content_version()
+
+
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+def donation_changed(sender, **kwargs):
+    invalidate_supporters()
+
+
 def process_donation(payment):
     if payment.state != Payment.ACCEPTED:
         raise ValueError("Can not process not accepted payment")
@@ -306,10 +374,15 @@ class Post(models.Model):
         default=False,
         help_text="This is an important milestone, shown on milestones archive",
     )
+    modified = models.DateTimeField(auto_now=True)
+    related = models.JSONField(default=list, blank=True, editable=False)
+    search_terms = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Blog post"
         verbose_name_plural = "Blog posts"
+        # Used by keyset pagination of archives
+        indexes = [models.Index(fields=["timestamp", "id"], name="post_keyset")]
 
     def __str__(self):
         return self.title
@@ -334,6 +407,121 @@ class Post(models.Model):
         return reverse("post", kwargs={"slug": self.slug})
 
 
+def get_news_version():
+    """Return version of the news used for conditional requests.
+
+    It is cached until any post is changed or the next scheduled post
+    is published.
+    """
+    version = cache.get(NEWS_VERSION_KEY)
+    if version is None:
+        now = timezone.now()
+        posts = Post.objects.aggregate(count=Count("id"), modified=Max("modified"))
+        published = Post.objects.filter(timestamp__lt=now).aggregate(
+            timestamp=Max("timestamp")
+        )["timestamp"]
+        upcoming = Post.objects.filter(timestamp__gte=now).aggregate(
+            timestamp=Min("timestamp")
+        )["timestamp"]
+        changes = [value for value in (published, posts["modified"]) if value]
+        version = {
+            "tag": "{}:{}:{}".format(
+                posts["count"],
+                published.isoformat() if published else "",
+                posts["modified"].isoformat() if posts["modified"] else "",
+            ),
+            "last_modified": max(changes) if changes else None,
+        }
+        timeout = NEWS_VERSION_TIMEOUT
+        if upcoming:
+            timeout = min(timeout, ceil((upcoming - now).total_seconds()) + 1)
+        cache.set(NEWS_VERSION_KEY, version, timeout)
+    return version
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, signal, instance, update_fields=None, **kwargs):
+    if signal is post_save:
+        from weblate_web.search import update_search_terms
+
+        update_search_terms(instance)
+    # Invalidating news version also makes search index to reload changes
+    cache.delete(NEWS_VERSION_KEY)
+    # Related posts are recomputed by the scheduler, summary does not
+    # affect them
+    if update_fields is None or set(update_fields) != {"summary"}:
+        cache.set(RELATED_CHANGED_KEY, True, None)
+
+
+def get_package_status(package):
+    if package.startswith("hosted:"):
+        return "hosted"
+    if package.startswith("shared:"):
+        return "shared"
+    return package
+
+
+def get_subscription_state(latest_expiry, now=None):
+    """Resolve service status from latest expiry of each subscribed package.
+
+    Returns dictionary with the status, package defining the limits, support
+    expiry and sets of subscribed and active offerings.
+    """
+    if now is None:
+        now = timezone.now()
+    latest = {}
+    for package, expires in latest_expiry:
+        status = get_package_status(package)
+        if status not in latest or expires > latest[status][1]:
+            latest[status] = (package, expires)
+    active = {status for status, (_package, expires) in latest.items() if expires > now}
+    status = next(
+        (status for status in SUPPORT_STATUSES if status in active), "community"
+    )
+    support = [latest[status][1] for status in SUPPORT_STATUSES if status in latest]
+    return {
+        "status": status,
+        "package": latest[status][0] if status in ("hosted", "shared") else "community",
+        "expires": max(support) if support else now,
+        "subscribed": set(latest),
+        "active": active,
+    }
+
+
+def load_subscription_states(services, subscriptions):
+    """Resolve subscription state of services using single grouped query."""
+    latest_expiry = defaultdict(list)
+    for service, package, expires in (
+        subscriptions.values_list("service", "package")
+        .annotate(Max("expires"))
+        .order_by()
+    ):
+        latest_expiry[service].append((package, expires))
+    for service in services:
+        service.subscription_state = get_subscription_state(latest_expiry[service.pk])
+
+
+def is_in_limits(limits, values):
+    """Check report values against service limits, zero means unlimited."""
+    return all(not limit or values[name] <= limit for name, limit in limits.items())
+
+
+def get_status_key(secret):
+    return "{}-{}".format(SERVICE_STATUS_KEY, md5(secret.encode()).hexdigest())
+
+
+def get_service_status(secret):
+    """Return cached status snapshot of service with given secret."""
+    snapshot = cache.get(get_status_key(secret))
+    if snapshot is None:
+        service = Service.objects.filter(secret=secret).first()
+        if service is None:
+            return None
+        snapshot = service.update_status()
+    return snapshot
+
+
 def generate_secret():
     return get_random_string(64)
 
@@ -385,6 +573,15 @@ class Service(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     note = models.TextField(blank=True)
     hosted_billing = models.IntegerField(default=0, db_index=True)
+    # Latest report, maintained by add_report
+    last_report = models.ForeignKey(
+        "Report",
+        on_delete=models.deletion.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+    )
 
     class Meta:
         verbose_name = "Customer service"
@@ -449,123 +646,115 @@ class Service(models.Model):
     def user_emails(self):
         return ", ".join(self.users.values_list("email", flat=True))
 
-    @cached_property
-    def last_report(self):
-        try:
-            return self.report_set.latest("timestamp")
-        except Report.DoesNotExist:
-            return None
-
-    @cached_property
-    def hosted_subscriptions(self):
-        return self.subscription_set.filter(package__startswith="hosted:")
-
-    @cached_property
-    def shared_subscriptions(self):
-        return self.subscription_set.filter(package__startswith="shared:")
-
-    @cached_property
-    def basic_subscriptions(self):
-        return self.subscription_set.filter(package="basic")
-
-    @cached_property
-    def extended_subscriptions(self):
-        return self.subscription_set.filter(package="extended")
-
-    @cached_property
-    def premium_subscriptions(self):
-        return self.subscription_set.filter(package="premium")
+    def add_report(self, **kwargs):
+        """Store new report and make it the latest one.
+
+        Report identical to the latest one only updates its timestamp.
+        """
+        report = Report(service=self, **kwargs)
+        report.normalize()
+        previous = self.last_report
+        with transaction.atomic():
+            if previous and previous.is_same(report):
+                previous.timestamp = timezone.now()
+                Report.objects.filter(pk=previous.pk).update(
+                    timestamp=previous.timestamp
+                )
+                return previous
+            report.save()
+            self.last_report = report
+            self.save(update_fields=["last_report"])
+        return report
 
     @cached_property
-    def support_subscriptions(self):
-        return (
-            self.hosted_subscriptions
-            | self.shared_subscriptions
-            | self.basic_subscriptions
-            | self.extended_subscriptions
-            | self.premium_subscriptions
+    def subscription_state(self):
+        return get_subscription_state(
+            self.subscription_set.values_list("package")
+            .annotate(Max("expires"))
+            .order_by()
         )
 
-    @cached_property
-    def backup_subscriptions(self):
-        return self.subscription_set.filter(package="backup")
-
-    @cached_property
+    @property
     def expires(self):
-        try:
-            return self.support_subscriptions.latest("expires").expires
-        except Subscription.DoesNotExist:
-            return timezone.now()
+        return self.subscription_state["expires"]
 
     def get_suggestions(self):
-        if not self.support_subscriptions.exists():
+        subscribed = self.subscription_state["subscribed"]
+        if not subscribed.intersection(SUPPORT_STATUSES):
             yield "basic", _("Basic support")
-        if (
-            not self.hosted_subscriptions.exists()
-            and not self.shared_subscriptions.exists()
-        ):
-            if not self.premium_subscriptions.exists():
+        if "hosted" not in subscribed and "shared" not in subscribed:
+            if "premium" not in subscribed:
                 yield "premium", _("Extended support")
-            if not self.extended_subscriptions.exists():
+            if "extended" not in subscribed:
                 yield "extended", _("Extended support")
-            if not self.backup_subscriptions.exists():
+            if "backup" not in subscribed:
                 yield "backup", _("Backup service")
 
-    def update_status(self):
-        status = "community"
-        package = "community"
-        if self.hosted_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "hosted"
-            package = self.hosted_subscriptions.latest("expires").package
-        elif self.shared_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "shared"
-            package = self.shared_subscriptions.latest("expires").package
-        elif self.premium_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "premium"
-        elif self.extended_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "extended"
-        elif self.basic_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "basic"
-
-        package_obj = Package.objects.get(name=package)
+    def update_status(self, packages=None):
+        state = self.subscription_state
+        if packages is None:
+            package_obj = Package.objects.get(name=state["package"])
+        else:
+            package_obj = packages[state["package"]]
 
         if (
-            status != self.status
+            state["status"] != self.status
             or package_obj.limit_source_strings != self.limit_source_strings
         ):
-            self.status = status
+            self.status = state["status"]
             self.limit_source_strings = package_obj.limit_source_strings
             self.limit_languages = package_obj.limit_languages
             self.limit_projects = package_obj.limit_projects
             self.save()
+        return self.store_status()
 
     def create_backup(self):
-        backup = False
-        if self.hosted_subscriptions.filter(expires__gt=timezone.now()).exists():
-            backup = True
-        if self.backup_subscriptions.filter(expires__gt=timezone.now()).exists():
-            backup = True
-        if backup and not self.backup_repository and self.report_set.exists():
+        backup = not self.subscription_state["active"].isdisjoint(("hosted", "backup"))
+        if backup and not self.backup_repository and self.last_report_id:
             self.backup_repository = create_backup_repository(self)
             self.save(update_fields=["backup_repository"])
+            self.store_status()
+
+    def get_limits(self):
+        return {name: getattr(self, "limit_{}".format(name)) for name in LIMIT_FIELDS}
 
     def check_in_limits(self):
-        if (
-            self.limit_source_strings
-            and self.last_report.source_strings > self.limit_source_strings
-        ):
-            return False
-        if self.limit_projects and self.last_report.projects > self.limit_projects:
-            return False
-        if self.limit_languages and self.last_report.languages > self.limit_languages:
-            return False
-        return True
+        report = self.last_report
+        if report is None:
+            return True
+        return is_in_limits(
+            self.get_limits(), {name: getattr(report, name) for name in LIMIT_FIELDS}
+        )
+
+    def store_status(self):
+        """Cache status snapshot used to answer the support API."""
+        snapshot = {
+            "pk": self.pk,
+            "name": self.status,
+            "expiry": self.expires,
+            "backup_repository": self.backup_repository,
+            "limits": self.get_limits(),
+        }
+        timeout = SERVICE_STATUS_TIMEOUT
+        # Expire the snapshot together with the subscription
+        remaining = (snapshot["expiry"] - timezone.now()).total_seconds()
+        if remaining > 0:
+            timeout = min(timeout, ceil(remaining) + 1)
+        cache.set(get_status_key(self.secret), snapshot, timeout)
+        return snapshot
 
     def regenerate(self):
+        cache.delete(get_status_key(self.secret))
         self.secret = generate_secret()
         self.save(update_fields=["secret"])
 
 
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def service_changed(sender, instance, **kwargs):
+    cache.delete(get_status_key(instance.secret))
+
+
 class Subscription(models.Model):
     service = models.ForeignKey(Service, on_delete=models.deletion.CASCADE)
     payment = models.UUIDField(blank=True, null=True)  # noqa: DJ01
@@ -584,6 +773,7 @@ class Subscription(models.Model):
         self, force_insert=False, force_update=False, using=None, update_fields=None
     ):
         super().save(force_insert, force_update, using, update_fields)
+        self.service.__dict__.pop("subscription_state", None)
         self.service.update_status()
 
     def get_absolute_url(self):
@@ -640,6 +830,13 @@ class Subscription(models.Model):
             )
 
 
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    service = Service.objects.filter(pk=instance.service_id).first()
+    if service is not None:
+        service.update_status()
+
+
 class PastPayments(models.Model):
     subscription = models.ForeignKey(
         Subscription, on_delete=models.deletion.CASCADE, null=True, blank=True
@@ -668,7 +865,7 @@ class Report(models.Model):
     components = models.IntegerField(default=0)
     languages = models.IntegerField(default=0)
     source_strings = models.IntegerField(default=0)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = "Weblate report"
@@ -676,3 +873,83 @@ class Report(models.Model):
 
     def __str__(self):
         return self.site_url
+
+    def normalize(self):
+        """Convert values to the types used when loaded from the database."""
+        for name in REPORT_FIELDS:
+            field = self._meta.get_field(name)
+            setattr(self, name, field.to_python(getattr(self, name)))
+
+    def is_same(self, other):
+        return all(
+            getattr(self, name) == getattr(other, name) for name in REPORT_FIELDS
+        )
+
+
+class ReportRollup(models.Model):
+    """Aggregated reports of a service for a day or a month."""
+
+    DAILY = "d"
+    MONTHLY = "m"
+
+    service = models.ForeignKey(Service, on_delete=models.deletion.CASCADE)
+    period = models.CharField(
+        max_length=1, choices=((DAILY, "Daily"), (MONTHLY, "Monthly"))
+    )
+    start = models.DateField()
+    reports = models.IntegerField(default=0)
+    users = models.IntegerField(default=0)
+    projects = models.IntegerField(default=0)
+    components = models.IntegerField(default=0)
+    languages = models.IntegerField(default=0)
+    source_strings = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [("service", "period", "start")]
+        verbose_name = "Weblate report rollup"
+        verbose_name_plural = "Weblate report rollups"
+
+    def __str__(self):
+        return "{}: {}".format(self.get_period_display(), self.start)
+
+
+class QueuedReport(models.Model):
+    """Report received by the support API waiting to be stored."""
+
+    # Not a foreign key, the service might be removed meanwhile
+    service = models.IntegerField()
+    values = models.JSONField()
+
+    class Meta:
+        verbose_name = "Queued Weblate report"
+        verbose_name_plural = "Queued Weblate reports"
+
+    def __str__(self):
+        return "{}: {}".format(self.service, self.values.get("site_url", ""))
+
+
+@receiver(post_delete, sender=Report)
+def report_deleted(sender, instance, **kwargs):
+    # Point to the previous report if the latest one was removed
+    Service.objects.filter(pk=instance.service_id, last_report=None).update(
+        last_report=Subquery(
+            Report.objects.filter(service=OuterRef("pk"))
+            .order_by("-timestamp", "-pk")
+            .values("pk")[:1]
+        )
+    )
+
+
+class RemoteData(models.Model):
+    """Last known good copy of data fetched from remote services."""
+
+    key = models.CharField(max_length=100, unique=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Remote data"
+        verbose_name_plural = "Remote data"
+
+    def __str__(self):
+        return self.key
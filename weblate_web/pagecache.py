@@ -0,0 +1,112 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Full page caching for anonymous users.
+
+The cache key includes content version which is bumped whenever data
+displayed on the pages change (remote data or supporters) and the
+current Weblate release, so the cached pages never need to be
+explicitly purged.
+
+Only the query parameters listed by the view are part of the key, other
+parameters do not change the page and would only fill the cache.
+
+Cached pages are served without rendering the template, so the context
+values used by the page are stored with it and evaluated again on cache
+hit (see weblate_web.context_processors.replay_context). This keeps stale
+remote data refreshing and the context usage statistics complete.
+"""
+
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.translation import get_language
+
+from weblate_web.data import VERSION
+
+PAGE_CACHE_TIMEOUT = 3600
+CONTENT_VERSION_KEY = "wlweb-content-version"
+
+
+def get_content_version():
+    version = cache.get(CONTENT_VERSION_KEY)
+    if version is None:
+        cache.add(CONTENT_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CONTENT_VERSION_KEY, 1)
+    return version
+
+
+def bump_content_version():
+    try:
+        cache.incr(CONTENT_VERSION_KEY)
+    except ValueError:
+        cache.add(CONTENT_VERSION_KEY, 2, timeout=None)
+
+
+def get_page_cache_key(request, params=()):
+    query = urlencode(
+        [(name, value) for name in params for value in request.GET.getlist(name)]
+    )
+    path = md5("{}?{}".format(request.path, query).encode()).hexdigest()
+    return "wlweb-page-{}-{}-{}-{}".format(
+        VERSION, get_content_version(), get_language(), path
+    )
+
+
+def is_cacheable_request(request):
+    """Only anonymous requests without pending messages are cached."""
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if request.user.is_authenticated:
+        return False
+    return not len(get_messages(request))
+
+
+def is_cacheable_response(request, response):
+    """Check whether rendered response can be shared across users."""
+    return (
+        response.status_code == 200
+        and not response.cookies
+        # Response including CSRF token is specific to the user
+        and not request.META.get("CSRF_COOKIE_USED")
+    )
+
+
+def store_page(request, key, response):
+    if is_cacheable_response(request, response):
+        context = getattr(request, "weblate_context", {})
+        cache.set(
+            key,
+            {
+                "content": response.content,
+                "headers": list(response.items()),
+                "context": [name for name, value in context.items() if value.evaluated],
+            },
+            PAGE_CACHE_TIMEOUT,
+        )
+
+
+def load_page(cached):
+    """Build response from the cached page."""
+    response = HttpResponse(cached["content"])
+    for header, value in cached["headers"]:
+        response[header] = value
+    return response
@@ -0,0 +1,153 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Related posts index.
+
+Posts are compared using cosine similarity of TF-IDF vectors built from
+the title and rendered body, posts in the same topic get a bonus. The
+result is stored in Post.related, so showing a post needs just one
+query to fetch the related ones.
+
+Computing the index needs all posts, so it is not done when saving a
+post. The change is only flagged and the background_fetch scheduler
+recomputes the index.
+"""
+
+import re
+from collections import Counter
+from math import log, sqrt
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from weblate_web.lease import acquire_lease, release_lease
+from weblate_web.models import NEWS_VERSION_KEY, RELATED_CHANGED_KEY, Post
+
+# Number of stored related posts, more than are shown to allow skipping
+# the not yet published ones
+RELATED_STORED = 6
+RELATED_COUNT = 3
+TOPIC_BONUS = 0.5
+# How often the scheduler checks for changed posts
+RELATED_INTERVAL = 60
+RELATED_LEASE = "wlweb-related"
+
+TAG_RE = re.compile(r"<[^>]+>")
+WORD_RE = re.compile(r"[^\W\d_]{3,}")
+
+
+def tokenize(post):
+    text = "{0} {0} {1}".format(post.title, TAG_RE.sub(" ", post.body.rendered))
+    return Counter(word.lower() for word in WORD_RE.findall(text))
+
+
+def get_vectors(documents):
+    """Convert term counts to normalized TF-IDF vectors."""
+    frequency = Counter()
+    for terms in documents.values():
+        frequency.update(terms.keys())
+    total = len(documents)
+    vectors = {}
+    for key, terms in documents.items():
+        length = sum(terms.values()) or 1
+        vector = {
+            term: count / length * log(total / frequency[term])
+            for term, count in terms.items()
+        }
+        norm = sqrt(sum(value * value for value in vector.values()))
+        if norm:
+            vector = {term: value / norm for term, value in vector.items()}
+        vectors[key] = vector
+    return vectors
+
+
+def similarity(first, second):
+    if len(first) > len(second):
+        first, second = second, first
+    return sum(value * second.get(term, 0) for term, value in first.items())
+
+
+def update_related_posts():
+    """Recompute related posts for all posts."""
+    posts = list(Post.objects.all())
+    vectors = get_vectors({post.pk: tokenize(post) for post in posts})
+    changed = []
+    now = timezone.now()
+    for post in posts:
+        scores = []
+        for other in posts:
+            if other.pk == post.pk:
+                continue
+            score = similarity(vectors[post.pk], vectors[other.pk])
+            if other.topic == post.topic:
+                score += TOPIC_BONUS
+            if score > 0:
+                scores.append((score, other.timestamp, other.pk))
+        scores.sort(reverse=True)
+        related = [pk for _score, _timestamp, pk in scores[:RELATED_STORED]]
+        if related != post.related:
+            post.related = related
+            post.modified = now
+            changed.append(post)
+    if changed:
+        Post.objects.bulk_update(changed, ["related", "modified"])
+        # Rendered post pages changed, conditional requests must not match
+        cache.delete(NEWS_VERSION_KEY)
+    return len(changed)
+
+
+def update_changed_related():
+    """Recompute related posts if some post changed."""
+    if not cache.get(RELATED_CHANGED_KEY):
+        return None
+    token = acquire_lease(RELATED_LEASE)
+    if token is None:
+        return None
+    try:
+        # Changes done while computing are picked up by the next run
+        cache.delete(RELATED_CHANGED_KEY)
+        try:
+            update_related_posts()
+        except Exception:
+            cache.set(RELATED_CHANGED_KEY, True, None)
+            raise
+    finally:
+        release_lease(RELATED_LEASE, token)
+    return True
+
+
+def get_related_posts(post, now):
+    """Return published related posts in the order of relevance.
+
+    Falls back to the latest posts in the same topic until the index is
+    computed.
+    """
+    if not post.related:
+        return list(
+            Post.objects.filter(topic=post.topic, timestamp__lt=now)
+            .exclude(pk=post.pk)
+            .select_related("image")
+            .order_by("-timestamp")[:RELATED_COUNT]
+        )
+    related = {
+        item.pk: item
+        for item in Post.objects.filter(
+            pk__in=post.related, timestamp__lt=now
+        ).select_related("image")
+    }
+    return [related[pk] for pk in post.related if pk in related][:RELATED_COUNT]
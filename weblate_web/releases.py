@@ -0,0 +1,153 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Metadata of released files.
+
+Size, checksum and modification time of release files are stored in a
+manifest in FILES_PATH, which is written by the update_files_manifest
+command as part of the release deployment. It is loaded once per process
+and checked for changes at most every MANIFEST_REFRESH seconds, so
+rendering download links does not need to hash the files. Manifest
+written for other version than the running one is considered outdated
+and ignored. Files not listed in the manifest are shown without a
+checksum, their size is looked up once and kept until the manifest
+changes.
+"""
+
+import json
+import os
+import time
+from hashlib import sha256
+from threading import Lock
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from weblate_web.data import EXTENSIONS, VERSION
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_REFRESH = 60
+
+MANIFEST_LOCK = Lock()
+MANIFEST = {"data": None, "mtime": None, "checked": 0, "fallback": {}}
+
+
+def get_release_files():
+    return ["Weblate-{0}.{1}".format(VERSION, ext) for ext in EXTENSIONS]
+
+
+def get_manifest_path():
+    return os.path.join(settings.FILES_PATH, MANIFEST_NAME)
+
+
+def get_mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+def get_file_info(name, previous=None, checksum=True):
+    """Return size, mtime and checksum of a file, None if it is missing."""
+    filename = os.path.join(settings.FILES_PATH, name)
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    result = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": None}
+    if (
+        previous
+        and previous["size"] == result["size"]
+        and previous["mtime"] == result["mtime"]
+    ):
+        result["sha256"] = previous["sha256"]
+    elif checksum:
+        digest = sha256()
+        with open(filename, "rb") as handle:
+            for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(chunk)
+        result["sha256"] = digest.hexdigest()
+    return result
+
+
+def generate_manifest():
+    """Generate manifest for current release files and store it.
+
+    Checksums of files unchanged since the previous manifest are reused.
+    """
+    previous = load_manifest()
+    files = previous["files"] if previous else {}
+    manifest = {
+        "version": VERSION,
+        "files": {
+            name: get_file_info(name, files.get(name)) for name in get_release_files()
+        },
+    }
+    filename = get_manifest_path()
+    with open(filename + ".tmp", "w") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    os.replace(filename + ".tmp", filename)
+    return manifest
+
+
+def load_manifest():
+    """Load manifest from the file, None if it is missing or invalid."""
+    try:
+        with open(get_manifest_path()) as handle:
+            manifest = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), dict):
+        return None
+    return manifest
+
+
+def get_manifest():
+    now = time.monotonic()
+    with MANIFEST_LOCK:
+        if MANIFEST["data"] is None or now - MANIFEST["checked"] > MANIFEST_REFRESH:
+            mtime = get_mtime(get_manifest_path())
+            if MANIFEST["data"] is None or mtime != MANIFEST["mtime"]:
+                manifest = load_manifest()
+                if manifest is None or manifest.get("version") != VERSION:
+                    manifest = {"version": None, "files": {}}
+                MANIFEST["data"] = manifest
+                MANIFEST["mtime"] = mtime
+                MANIFEST["fallback"] = {}
+            MANIFEST["checked"] = now
+        return MANIFEST["data"]
+
+
+def get_release_info(name):
+    """Return metadata for a file, None if the file does not exist."""
+    info = get_manifest()["files"].get(name)
+    if info is None:
+        # Not listed in the manifest, show at least the size
+        fallback = MANIFEST["fallback"]
+        if name not in fallback:
+            fallback[name] = get_file_info(name, checksum=False)
+        info = fallback[name]
+    return info
+
+
+@receiver(setting_changed)
+def reset_manifest(*, setting, **kwargs):
+    if setting == "FILES_PATH":
+        with MANIFEST_LOCK:
+            MANIFEST["data"] = None
@@ -16,90 +16,468 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
-"""Remote data fetching and caching."""
+"""Remote data fetching and caching.
 
+The data is served from the cache even when it is stale, the refresh is
+performed in a background thread. The last known good copy is stored in the
+database, so it survives cache flush.
+
+Only one process in the cluster refreshes given data at time, this is
+ensured by a lease stored in the cache.
+"""
+
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+import dateutil.parser
 import requests
 import sentry_sdk
 from django.conf import settings
 from django.core.cache import cache
-from wlc import Weblate, WeblateException
+from django.db import connections
+from wlc import USER_AGENT, Weblate, WeblateException
+
+import outbound
+from weblate_web.lease import acquire_lease, is_leased, release_lease
+from weblate_web.models import RemoteData
+from weblate_web.pagecache import bump_content_version
 
 CONTRIBUTORS_URL = "https://api.github.com/repos/{}/{}/stats/contributors"
 WEBLATE_CONTRIBUTORS_URL = CONTRIBUTORS_URL.format("WeblateOrg", "weblate")
 EXCLUDE_USERS = {"nijel", "weblate"}
 ACTIVITY_URL = "https://hosted.weblate.org/activity/month.json"
+ACTIVITY_SVG_KEY = "wlweb-activity-svg"
+ACTIVITY_SVG = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg xmlns="http://www.w3.org/2000/svg" height="86" viewBox="0 0 247 86" \
+width="247" version="1.1" id="svg74">
+  <g transform="translate(0 8)" id="g72">
+{}
+  </g>
+</svg>
+"""
 
+# How long is the fetched data considered fresh
+REMOTE_TIMEOUT = 3600
+# How long to wait for other process to fetch missing data
+LEASE_WAIT = 2
+LEASE_POLL = 0.1
 
-def get_contributors(force=False):
-    key = "wlweb-contributors"
-    results = cache.get(key)
-    if not force and results is not None:
-        return results
+COUNTERS = ("hit", "stale", "miss", "wait", "fetch", "locked")
+
+# Number of parallel requests to the Weblate API, should not exceed
+# outbound connections pool size
+CHANGES_WORKERS = 8
+# Connect and read timeout for the Weblate API requests
+CHANGES_TIMEOUT = (5, 20)
+
+REFRESHING = set()
+REFRESHING_LOCK = threading.Lock()
+
+
+def rank_contributor(stat, previous=None):
+    """Calculate contributor rank.
+
+    Returns the rank and snapshot of already summed weeks, which can be
+    passed as previous on next ranking to avoid summing all the weeks
+    again. The last week is still in progress, so it is not included in
+    the snapshot.
+    """
+    weeks = stat["weeks"]
+    if not weeks:
+        return stat["total"], None
+    start = 0
+    changes = 0
+    if (
+        previous
+        and previous["first"] == weeks[0]["w"]
+        and previous["count"] < len(weeks)
+    ):
+        start = previous["count"]
+        changes = previous["sum"]
+    for week in weeks[start:-1]:
+        changes += week["a"] + week["d"]
+    snapshot = {"first": weeks[0]["w"], "count": len(weeks) - 1, "sum": changes}
+    last = weeks[-1]
+    return stat["total"] + changes + last["a"] + last["d"], snapshot
+
+
+def fetch_contributors():
+    key = "wlweb-contributors-snapshot"
+    snapshot = RemoteData.objects.filter(key=key).first()
+    headers = {}
+    if snapshot is not None and snapshot.data["etag"]:
+        headers["If-None-Match"] = snapshot.data["etag"]
     # Perform request
     try:
-        response = requests.get(WEBLATE_CONTRIBUTORS_URL)
+        response = outbound.get(WEBLATE_CONTRIBUTORS_URL, headers=headers)
+        if response.status_code == 304:
+            # Not modified, reuse stored data
+            cached = get_cached("wlweb-contributors")
+            if cached is None:
+                cached = load_remote("wlweb-contributors")
+            if cached is not None:
+                return cached["data"]
+            response = outbound.get(WEBLATE_CONTRIBUTORS_URL)
     except IOError as error:
         sentry_sdk.capture_exception(error)
-        response = None
+        return None
     # Stats are not yet calculated
-    if response is None or response.status_code != 200:
-        return []
+    if response.status_code != 200:
+        return None
 
     stats = response.json()
+    previous = snapshot.data["authors"] if snapshot is not None else {}
+    authors = {}
     # Fill in ranking. This seems to best reflect people effort, but still
     # is not accurate at all. The problem is that commits stats are
     # misleading due to high number of commits generated by old Weblate
     # versions. Additions are heavily biased by adding new translation files.
     for stat in stats:
-        if stat["author"] and stat["author"]["login"] in EXCLUDE_USERS:
+        login = stat["author"]["login"] if stat["author"] else None
+        if login in EXCLUDE_USERS:
             stat["rank"] = 0
             continue
-        stat["rank"] = stat["total"] + sum(
-            (week["a"] + week["d"] for week in stat["weeks"])
-        )
+        stat["rank"], authors[login] = rank_contributor(stat, previous.get(login))
 
-    stats.sort(key=lambda x: -x["rank"])
+    authors.pop(None, None)
+    RemoteData.objects.update_or_create(
+        key=key,
+        defaults={"data": {"etag": response.headers.get("ETag"), "authors": authors}},
+    )
 
-    data = stats[:8]
-    cache.set(key, data, timeout=3600)
-    return data
+    # Weekly stats are not needed for display
+    return [
+        {"author": stat["author"], "total": stat["total"], "rank": stat["rank"]}
+        for stat in heapq.nlargest(8, stats, key=lambda x: x["rank"])
+    ]
 
 
-def get_activity(force=False):
-    key = "wlweb-activity-stats"
-    results = cache.get(key)
-    if not force and results is not None:
-        return results
+def fetch_activity():
     # Perform request
     try:
-        response = requests.get(ACTIVITY_URL)
+        response = outbound.get(ACTIVITY_URL)
     except IOError as error:
         sentry_sdk.capture_exception(error)
-        response = None
+        return None
     # Stats are not yet calculated
-    if response is None or response.status_code != 200:
-        return []
+    if response.status_code != 200:
+        return None
 
     stats = response.json()
-    data = stats[-25:]
-    cache.set(key, data, timeout=3600)
-    return data
+    return stats[-25:]
 
 
-def get_changes(force=False):
-    key = "wlweb-changes-list"
-    results = cache.get(key)
-    if not force and results is not None:
-        return results
+def render_activity_svg(data):
+    """Render activity bar chart as SVG."""
+    bars = []
+    opacities = {0: ".1", 1: ".3", 2: ".5", 3: ".7"}
+    top_count = max(data) if data else 0
+    for i, count in enumerate(data):
+        height = int(76 * count / top_count) if top_count else 0
+        item = {
+            "rx": 2,
+            "width": 6,
+            "height": height,
+            "id": "b{}".format(i),
+            "x": 10 * i,
+            "y": 86 - height,
+        }
+        if height < 20:
+            item["fill"] = "#f6664c"
+        elif height < 45:
+            item["fill"] = "#38f"
+        else:
+            item["fill"] = "#2eccaa"
+        if i in opacities:
+            item["opacity"] = opacities[i]
+
+        bars.append(
+            "    <rect {} />".format(
+                " ".join('{}="{}"'.format(attr, value) for attr, value in item.items())
+            )
+        )
+
+    return ACTIVITY_SVG.format("\n".join(bars)).encode()
+
+
+def store_activity_svg(data):
+    """Render and cache activity SVG together with its ETag."""
+    content = render_activity_svg(data)
+    result = {
+        "data": data,
+        "content": content,
+        "etag": '"{}"'.format(sha256(content).hexdigest()[:32]),
+    }
+    cache.set(ACTIVITY_SVG_KEY, result, timeout=None)
+    return result
+
+
+def get_activity_svg():
+    """Return pre-rendered activity SVG matching current activity data."""
+    data = get_activity()
+    result = cache.get(ACTIVITY_SVG_KEY)
+    if result is None or result["data"] != data:
+        result = store_activity_svg(data)
+    return result
+
+
+class OutboundWeblate(Weblate):
+    """Weblate API client using shared outbound HTTP client."""
+
+    def __init__(self, timeout, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+
+    def invoke_request(self, method, path, params=None, files=None):
+        if not path.startswith("http"):
+            path = "{0}{1}".format(self.url, path)
+        headers = {"user-agent": USER_AGENT, "Accept": "application/json"}
+        if self.key:
+            headers["Authorization"] = "Token {}".format(self.key)
+        if files:
+            kwargs = {"data": params}
+        else:
+            kwargs = {"json": params}
+        try:
+            response = outbound.request(
+                method,
+                path,
+                timeout=self.timeout,
+                headers=headers,
+                verify=self._should_verify_ssl(path),
+                files=files,
+                **kwargs,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as error:
+            self.process_error(error)
+            raise
+        return response
+
+
+def fetch_project_changes(project):
+    stats = project.statistics()
+    if stats["last_change"] is None:
+        return None
+    return stats.get_data()
+
+
+def fetch_changes():
+    # Previous data is used for projects which fail to fetch
+    cached = get_cached("wlweb-changes-list")
+    previous = {item["name"]: item for item in cached["data"]} if cached else {}
+
+    client = OutboundWeblate(
+        CHANGES_TIMEOUT, key=settings.CHANGES_KEY, url=settings.CHANGES_API
+    )
     try:
-        wlc = Weblate(key=settings.CHANGES_KEY, url=settings.CHANGES_API)
+        projects = list(client.list_projects())
+    except (WeblateException, IOError) as error:
+        sentry_sdk.capture_exception(error)
+        return None
+
+    with ThreadPoolExecutor(max_workers=CHANGES_WORKERS) as executor:
+        futures = [
+            (project, executor.submit(fetch_project_changes, project))
+            for project in projects
+        ]
+
+    stats = []
+    failed = 0
+    for project, future in futures:
+        try:
+            result = future.result()
+        except (WeblateException, IOError) as error:
+            sentry_sdk.capture_exception(error)
+            failed += 1
+            result = previous.get(project["name"])
+        if result is not None:
+            stats.append(result)
 
-        stats = [p.statistics() for p in wlc.list_projects()]
-        stats = [p.get_data() for p in stats if p["last_change"] is not None]
-    except WeblateException:
-        return []
+    # Keep last known good data if nothing was fetched
+    if failed and not stats:
+        return None
 
     stats.sort(key=lambda x: x["last_change"], reverse=True)
 
-    cache.set(key, stats[:10], timeout=3600)
     return stats[:10]
+
+
+def parse_changes(data):
+    """Convert timestamps serialized in the database back to datetime."""
+    for item in data:
+        if isinstance(item["last_change"], str):
+            item["last_change"] = dateutil.parser.parse(item["last_change"])
+    return data
+
+
+def get_cached(key):
+    """Return cached remote data.
+
+    Entries stored by older versions contain the bare data without the
+    timestamp, these are handled as a cache miss.
+    """
+    cached = cache.get(key)
+    if not isinstance(cached, dict):
+        return None
+    return cached
+
+
+def store_remote(key, data):
+    """Store fetched data in the cache and the database."""
+    previous = get_cached(key)
+    RemoteData.objects.update_or_create(key=key, defaults={"data": data})
+    cache.set(key, {"data": data, "updated": time.time()}, timeout=None)
+    if previous is None or previous["data"] != data:
+        bump_content_version()
+    if key in STORE_HOOKS:
+        STORE_HOOKS[key](data)
+
+
+def load_remote(key, parse=None):
+    """Load last known good data from the database."""
+    try:
+        remote = RemoteData.objects.get(key=key)
+    except RemoteData.DoesNotExist:
+        return None
+    data = remote.data
+    if parse is not None:
+        data = parse(data)
+    result = {"data": data, "updated": remote.updated.timestamp()}
+    cache.set(key, result, timeout=None)
+    return result
+
+
+def increment_counter(key, counter):
+    name = "{}-counter-{}".format(key, counter)
+    try:
+        cache.incr(name)
+    except ValueError:
+        # First use of the counter
+        cache.add(name, 0, timeout=None)
+        cache.incr(name)
+
+
+def get_counters(key):
+    """Return cache usage counters for remote data."""
+    names = {"{}-counter-{}".format(key, counter): counter for counter in COUNTERS}
+    values = cache.get_many(names.keys())
+    return {counter: values.get(name, 0) for name, counter in names.items()}
+
+
+def wait_remote(key):
+    """Wait for refresh performed by other process."""
+    increment_counter(key, "wait")
+    deadline = time.monotonic() + LEASE_WAIT
+    while is_leased(key) and time.monotonic() < deadline:
+        time.sleep(LEASE_POLL)
+    return get_cached(key)
+
+
+def refresh_remote(key, fetch):
+    """Fetch remote data and store it on success.
+
+    Returns None in case fetching has failed or other process is
+    refreshing the data.
+    """
+    token = acquire_lease(key)
+    if token is None:
+        increment_counter(key, "locked")
+        return None
+    try:
+        increment_counter(key, "fetch")
+        data = fetch()
+        if data is not None:
+            store_remote(key, data)
+        return data
+    finally:
+        release_lease(key, token)
+
+
+def background_refresh(key, fetch):
+    try:
+        refresh_remote(key, fetch)
+    except Exception as error:  # pylint: disable=broad-except
+        sentry_sdk.capture_exception(error)
+    finally:
+        with REFRESHING_LOCK:
+            REFRESHING.discard(key)
+        # Threads use own database connections
+        connections.close_all()
+
+
+def schedule_refresh(key, fetch):
+    """Refresh remote data in a background thread."""
+    with REFRESHING_LOCK:
+        if key in REFRESHING:
+            return
+        REFRESHING.add(key)
+    thread = threading.Thread(
+        target=background_refresh, args=(key, fetch), name=key, daemon=True
+    )
+    thread.start()
+
+
+def get_remote(key, fetch, force=False, parse=None):
+    """Return remote data, refreshing it in background when stale.
+
+    With force the data is fetched synchronously, the last known good
+    data is returned in case fetching fails.
+    """
+    if force:
+        data = refresh_remote(key, fetch)
+        if data is not None:
+            return data
+        # Other process might be fetching the data right now
+        if is_leased(key):
+            wait_remote(key)
+
+    cached = get_cached(key)
+    if cached is None:
+        cached = load_remote(key, parse)
+
+    if cached is None:
+        increment_counter(key, "miss")
+        if not force:
+            if is_leased(key):
+                # Wait briefly for other process fetching the data
+                cached = wait_remote(key)
+            else:
+                schedule_refresh(key, fetch)
+        if cached is None:
+            return []
+    elif not force:
+        if cached["updated"] + REMOTE_TIMEOUT < time.time():
+            increment_counter(key, "stale")
+            if not is_leased(key):
+                schedule_refresh(key, fetch)
+        else:
+            increment_counter(key, "hit")
+
+    return cached["data"]
+
+
+# Remote data sources, used by the background refresh
+REMOTE_DATA = {
+    "contributors": ("wlweb-contributors", fetch_contributors),
+    "activity": ("wlweb-activity-stats", fetch_activity),
+    "changes": ("wlweb-changes-list", fetch_changes),
+}
+
+# Processing of freshly stored data
+STORE_HOOKS = {"wlweb-activity-stats": store_activity_svg}
+
+
+def get_contributors(force=False):
+    return get_remote("wlweb-contributors", fetch_contributors, force)
+
+
+def get_activity(force=False):
+    return get_remote("wlweb-activity-stats", fetch_activity, force)
+
+
+def get_changes(force=False):
+    return get_remote("wlweb-changes-list", fetch_changes, force, parse_changes)
@@ -0,0 +1,264 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Ingestion and compaction of service reports.
+
+Reports received by the support API are queued in the QueuedReport
+table and stored in bulk by flush_reports, which runs in the background.
+Backup repositories of the reporting services are provisioned by a
+separate job, so that storing reports does not wait for the storage box.
+
+Raw reports are kept for RAW_RETENTION, older ones are merged into daily
+rollups keeping the maximal values and number of reports. Daily rollups
+older than DAILY_RETENTION are merged into monthly ones. The latest
+report of every service is always kept.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from weblate_web.lease import acquire_lease, release_lease
+from weblate_web.models import (
+    Package,
+    QueuedReport,
+    Report,
+    ReportRollup,
+    Service,
+    Subscription,
+    load_subscription_states,
+)
+
+QUEUE_KEY = "wlweb-report-queue"
+FLUSH_INTERVAL = 10
+FLUSH_BATCH_SIZE = 500
+BACKUP_KEY = "wlweb-backups"
+BACKUP_INTERVAL = 300
+
+RAW_RETENTION = timedelta(days=30)
+DAILY_RETENTION = timedelta(days=365)
+BATCH_SIZE = 1000
+
+ROLLUP_FIELDS = ("users", "projects", "components", "languages", "source_strings")
+
+
+def queue_report(service, values):
+    """Queue report for the service to be stored by flush_reports."""
+    QueuedReport.objects.create(service=service, values=values)
+
+
+def store_reports(entries):
+    """Store queued reports and update status of the reporting services."""
+    if not entries:
+        return 0
+    services = Service.objects.select_related("last_report").in_bulk(
+        {service for service, _values in entries}
+    )
+    latest = {pk: service.last_report for pk, service in services.items()}
+    reports = []
+    touched = set()
+    for pk, values in entries:
+        # Service removed meanwhile
+        if pk not in services:
+            continue
+        report = Report(service_id=pk, **values)
+        report.normalize()
+        previous = latest[pk]
+        if previous is not None and previous.is_same(report):
+            if previous.pk is not None:
+                touched.add(previous.pk)
+            continue
+        reports.append(report)
+        latest[pk] = report
+
+    with transaction.atomic():
+        Report.objects.bulk_create(reports)
+        Report.objects.filter(pk__in=touched).update(timestamp=timezone.now())
+        # The primary keys are not available after bulk_create on all databases
+        Service.objects.filter(pk__in={report.service_id for report in reports}).update(
+            last_report=Subquery(
+                Report.objects.filter(service=OuterRef("pk"))
+                .order_by("-timestamp", "-pk")
+                .values("pk")[:1]
+            )
+        )
+
+    services = list(
+        Service.objects.filter(pk__in=list(services)).select_related("last_report")
+    )
+    load_subscription_states(
+        services, Subscription.objects.filter(service__in=services)
+    )
+    packages = {package.name: package for package in Package.objects.all()}
+    for service in services:
+        service.update_status(packages)
+    return len(reports)
+
+
+def flush_reports(batch_size=FLUSH_BATCH_SIZE):
+    """Store queued reports.
+
+    Returns number of processed queue entries or None if other process is
+    flushing the queue.
+    """
+    token = acquire_lease(QUEUE_KEY)
+    if token is None:
+        return None
+    try:
+        # Reports queued meanwhile are left for the next run
+        last = QueuedReport.objects.aggregate(Max("pk"))["pk__max"]
+        processed = 0
+        while last is not None:
+            with transaction.atomic():
+                entries = list(
+                    QueuedReport.objects.filter(pk__lte=last)
+                    .order_by("pk")
+                    .values_list("pk", "service", "values")[:batch_size]
+                )
+                if not entries:
+                    break
+                store_reports([(service, values) for _pk, service, values in entries])
+                QueuedReport.objects.filter(
+                    pk__in=[pk for pk, _service, _values in entries]
+                ).delete()
+            processed += len(entries)
+        return processed
+    finally:
+        release_lease(QUEUE_KEY, token)
+
+
+def provision_backups():
+    """Create backup repositories for services which have none yet."""
+    token = acquire_lease(BACKUP_KEY)
+    if token is None:
+        return None
+    try:
+        services = list(
+            Service.objects.filter(
+                backup_repository="",
+                last_report__isnull=False,
+                subscription__expires__gt=timezone.now(),
+            )
+            .select_related("last_report")
+            .distinct()
+        )
+        load_subscription_states(
+            services, Subscription.objects.filter(service__in=services)
+        )
+        for service in services:
+            service.create_backup()
+        return True
+    finally:
+        release_lease(BACKUP_KEY, token)
+
+
+def merge_rollups(period, rows):
+    """Merge rows of (service, start, reports, values) into rollups."""
+    aggregated = {}
+    for service, start, reports, values in rows:
+        current = aggregated.get((service, start))
+        if current is None:
+            aggregated[service, start] = dict(values, reports=reports)
+            continue
+        current["reports"] += reports
+        for field in ROLLUP_FIELDS:
+            current[field] = max(current[field], values[field])
+
+    changed = []
+    existing = ReportRollup.objects.filter(
+        period=period,
+        service__in={service for service, _start in aggregated},
+        start__in={start for _service, start in aggregated},
+    )
+    for rollup in existing:
+        values = aggregated.pop((rollup.service_id, rollup.start), None)
+        if values is None:
+            continue
+        rollup.reports += values["reports"]
+        for field in ROLLUP_FIELDS:
+            setattr(rollup, field, max(getattr(rollup, field), values[field]))
+        changed.append(rollup)
+    ReportRollup.objects.bulk_update(changed, ("reports",) + ROLLUP_FIELDS)
+    ReportRollup.objects.bulk_create(
+        ReportRollup(service_id=service, period=period, start=start, **values)
+        for (service, start), values in aggregated.items()
+    )
+
+
+def compact_reports(now=None, batch_size=BATCH_SIZE):
+    """Merge batch of old raw reports into daily rollups."""
+    if now is None:
+        now = timezone.now()
+    with transaction.atomic():
+        reports = list(
+            Report.objects.filter(timestamp__lt=now - RAW_RETENTION)
+            .exclude(
+                pk__in=Service.objects.exclude(last_report=None).values("last_report")
+            )
+            .order_by("timestamp")
+            .values_list("pk", "service", "timestamp", *ROLLUP_FIELDS)[:batch_size]
+        )
+        if not reports:
+            return 0
+        merge_rollups(
+            ReportRollup.DAILY,
+            (
+                (service, timestamp.date(), 1, dict(zip(ROLLUP_FIELDS, values)))
+                for _pk, service, timestamp, *values in reports
+            ),
+        )
+        # Latest reports are excluded above, so there is nothing to re-point
+        # on deletion and the rows can be removed without signals
+        compacted = Report.objects.filter(pk__in=[report[0] for report in reports])
+        compacted._raw_delete(compacted.db)
+    return len(reports)
+
+
+def compact_rollups(now=None, batch_size=BATCH_SIZE):
+    """Merge batch of old daily rollups into monthly rollups."""
+    if now is None:
+        now = timezone.now()
+    with transaction.atomic():
+        rollups = list(
+            ReportRollup.objects.filter(
+                period=ReportRollup.DAILY,
+                start__lt=(now - DAILY_RETENTION).date(),
+            )
+            .order_by("start")
+            .values_list("pk", "service", "start", "reports", *ROLLUP_FIELDS)[
+                :batch_size
+            ]
+        )
+        if not rollups:
+            return 0
+        merge_rollups(
+            ReportRollup.MONTHLY,
+            (
+                (
+                    service,
+                    start.replace(day=1),
+                    reports,
+                    dict(zip(ROLLUP_FIELDS, values)),
+                )
+                for _pk, service, start, reports, *values in rollups
+            ),
+        )
+        ReportRollup.objects.filter(pk__in=[rollup[0] for rollup in rollups]).delete()
+    return len(rollups)
@@ -0,0 +1,185 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Periodic background jobs.
+
+Every job runs on its own interval with random jitter, failing jobs are
+retried with exponential backoff. Jobs are executed concurrently and a job
+is never started while its previous run is still in progress.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sentry_sdk
+from django.core.cache import cache
+from django.db import connections
+
+from weblate_web.lease import is_leased
+from weblate_web.related import RELATED_INTERVAL, update_changed_related
+from weblate_web.remote import REMOTE_DATA, refresh_remote
+from weblate_web.reports import (
+    BACKUP_INTERVAL,
+    FLUSH_INTERVAL,
+    flush_reports,
+    provision_backups,
+)
+from weblate_web.sitemaps import SITEMAP_INTERVAL, update_sitemaps
+
+STATUS_KEY = "wlweb-scheduler-status"
+
+
+class Job:
+    """Periodic job.
+
+    The function returns True on success, False on failure and None when
+    the run was skipped (for example when other process does the work).
+    """
+
+    def __init__(self, name, func, interval, jitter=0.1, backoff=60):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff = backoff
+        self.running = False
+        self.failures = 0
+        self.next_run = 0
+        self.status = {
+            "last_attempt": None,
+            "last_success": None,
+            "last_error": None,
+            "failures": 0,
+            "next_run": None,
+        }
+
+    def get_delay(self):
+        if self.failures:
+            delay = min(self.interval, self.backoff * 2 ** (self.failures - 1))
+        else:
+            delay = self.interval
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run(self):
+        now = time.time()
+        self.status["last_attempt"] = now
+        try:
+            result = self.func()
+        except Exception as error:  # pylint: disable=broad-except
+            sentry_sdk.capture_exception(error)
+            self.status["last_error"] = str(error)
+            result = False
+        finally:
+            # Threads use own database connections
+            connections.close_all()
+        if result:
+            self.failures = 0
+            self.status["last_success"] = now
+            self.status["last_error"] = None
+        elif result is not None:
+            self.failures += 1
+        self.status["failures"] = self.failures
+        self.next_run = time.time() + self.get_delay()
+        self.status["next_run"] = self.next_run
+        self.running = False
+        return result
+
+
+class Scheduler:
+    def __init__(self, jobs, workers=None):
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(max_workers=workers or len(jobs))
+        self.lock = threading.Lock()
+        # Keep status from previous runs
+        status = get_status()
+        for job in jobs:
+            job.status.update(status.get(job.name, {}))
+
+    def run_pending(self, now=None):
+        """Start all due jobs which are not already running."""
+        if now is None:
+            now = time.time()
+        futures = []
+        with self.lock:
+            for job in self.jobs:
+                if job.running or job.next_run > now:
+                    continue
+                job.running = True
+                futures.append(self.executor.submit(self.run_job, job))
+        return futures
+
+    def run_job(self, job):
+        result = job.run()
+        self.store_status()
+        return result
+
+    def store_status(self):
+        cache.set(
+            STATUS_KEY,
+            {job.name: dict(job.status) for job in self.jobs},
+            timeout=None,
+        )
+
+    def run_forever(self, stop=None, tick=1):
+        if stop is None:
+            stop = threading.Event()
+        while not stop.is_set():
+            self.run_pending()
+            stop.wait(tick)
+        self.executor.shutdown(wait=True)
+
+
+def get_status():
+    """Return status of the background jobs as stored by the scheduler."""
+    return cache.get(STATUS_KEY, {})
+
+
+def remote_job(key, fetch):
+    def refresh():
+        # Other process is already refreshing the data
+        if is_leased(key):
+            return None
+        return refresh_remote(key, fetch) is not None
+
+    return refresh
+
+
+def get_remote_jobs(interval):
+    return [
+        Job(name, remote_job(key, fetch), interval)
+        for name, (key, fetch) in REMOTE_DATA.items()
+    ]
+
+
+def reports_job():
+    # Other process is already flushing the queue
+    if flush_reports() is None:
+        return None
+    return True
+
+
+def get_jobs(interval):
+    """Return all background jobs, remote data use the given interval."""
+    return get_remote_jobs(interval) + [
+        Job("reports", reports_job, FLUSH_INTERVAL),
+        Job("backups", provision_backups, BACKUP_INTERVAL),
+        Job("related", update_changed_related, RELATED_INTERVAL),
+        Job("sitemaps", update_sitemaps, SITEMAP_INTERVAL),
+    ]
@@ -0,0 +1,313 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Full-text search in blog posts.
+
+Term frequencies of the title, summary and rendered body are stored in
+Post.search_terms whenever a post is saved. Each process keeps an
+inverted index built from them in memory and applies changes
+incrementally once the news version changes, so the database is not
+queried for the search itself.
+
+Results are ranked using BM25 over the complete posting lists, so every
+matching post is found and counted. The term frequency part of BM25
+weights is cached per term and kept up to date as posts are added or
+removed, it is only computed again once the average post length drifts.
+The IDF is applied while searching and only the requested page of
+results is put in order, using a heap.
+"""
+
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from heapq import nlargest
+from html import unescape
+from math import log
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from weblate_web.models import NEWS_VERSION_KEY, Post, get_news_version
+
+TAG_RE = re.compile(r"<[^>]+>")
+WORD_RE = re.compile(r"\w{2,}")
+
+TITLE_WEIGHT = 3
+SUMMARY_WEIGHT = 2
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Relative change of average document length invalidating cached weights
+AVERAGE_TOLERANCE = 0.01
+
+SNIPPET_LENGTH = 200
+SNIPPET_CONTEXT = 60
+
+INDEX = {"index": None, "version": None, "modified": None}
+INDEX_LOCK = threading.Lock()
+
+
+def tokenize(text):
+    return [word.lower() for word in WORD_RE.findall(text)]
+
+
+def get_post_text(post):
+    return unescape(TAG_RE.sub(" ", post.body.rendered))
+
+
+def get_search_terms(post):
+    terms = defaultdict(int)
+    for text, weight in (
+        (post.title, TITLE_WEIGHT),
+        (post.summary, SUMMARY_WEIGHT),
+        (get_post_text(post), 1),
+    ):
+        for word in tokenize(text):
+            terms[word] += weight
+    return dict(terms)
+
+
+def update_search_terms(post):
+    """Store search terms of a saved post."""
+    post.search_terms = get_search_terms(post)
+    Post.objects.filter(pk=post.pk).update(search_terms=post.search_terms)
+
+
+def update_search_index():
+    """Recompute search terms for all posts."""
+    now = timezone.now()
+    changed = []
+    for post in Post.objects.all():
+        terms = get_search_terms(post)
+        if terms != post.search_terms:
+            post.search_terms = terms
+            # Processes pick up changes based on the modification time
+            post.modified = now
+            changed.append(post)
+    if changed:
+        Post.objects.bulk_update(changed, ["search_terms", "modified"])
+        cache.delete(NEWS_VERSION_KEY)
+    return len(changed)
+
+
+def get_frequency_weights(postings, documents, average):
+    """Return term frequency part of BM25 weights for the postings."""
+    norm = K1 * (1 - B)
+    scale = K1 * B / average
+    return {
+        key: count * (K1 + 1) / (count + norm + scale * documents[key][1])
+        for key, count in postings.items()
+    }
+
+
+class SearchIndex:
+    """In-memory inverted index with BM25 ranking."""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.total_length = 0
+        # Documents ordered by timestamp to skip not yet published ones
+        self.timeline = []
+        # Term frequency weights together with average document length
+        # they were computed for
+        self.weights = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, key, terms, timestamp):
+        self.remove(key)
+        length = sum(terms.values())
+        self.documents[key] = (terms, length, timestamp)
+        self.total_length += length
+        for term, count in terms.items():
+            self.postings[term][key] = count
+            cached = self.weights.get(term)
+            if cached is not None:
+                average, weights = cached
+                weights.update(
+                    get_frequency_weights({key: count}, self.documents, average)
+                )
+        insort(self.timeline, (timestamp, key))
+
+    def remove(self, key):
+        if key not in self.documents:
+            return
+        terms, length, timestamp = self.documents.pop(key)
+        self.total_length -= length
+        for term in terms:
+            postings = self.postings[term]
+            del postings[key]
+            if not postings:
+                del self.postings[term]
+                self.weights.pop(term, None)
+            elif term in self.weights:
+                del self.weights[term][1][key]
+        self.timeline.remove((timestamp, key))
+
+    def get_idf(self, term):
+        total = len(self.documents)
+        found = len(self.postings[term])
+        return log(1 + (total - found + 0.5) / (found + 0.5))
+
+    def get_weights(self, term):
+        """Return term frequency weights of the term in documents containing it."""
+        average = self.total_length / len(self.documents)
+        cached = self.weights.get(term)
+        if cached is not None and abs(cached[0] - average) <= (
+            AVERAGE_TOLERANCE * average
+        ):
+            return cached[1]
+        weights = get_frequency_weights(self.postings[term], self.documents, average)
+        self.weights[term] = (average, weights)
+        return weights
+
+    def get_scheduled(self, now):
+        """Return keys of documents with timestamp not before now."""
+        start = bisect_left(self.timeline, (now,))
+        return [key for _timestamp, key in self.timeline[start:]]
+
+    def search(self, terms, now=None):
+        """Return scores of all matching documents.
+
+        The scores are divided by IDF of the most frequent term, this does
+        not change the ranking and allows to return the cached weights for
+        single term searches. The result can be shared with the index and
+        must not be modified.
+        """
+        terms = [term for term in dict.fromkeys(terms) if term in self.postings]
+        if not terms:
+            return {}
+        terms.sort(key=lambda term: len(self.postings[term]), reverse=True)
+        scores = self.get_weights(terms[0])
+        if len(terms) > 1:
+            scores = dict(scores)
+            base = self.get_idf(terms[0])
+            for term in terms[1:]:
+                ratio = self.get_idf(term) / base
+                for key, weight in self.get_weights(term).items():
+                    scores[key] = scores.get(key, 0) + ratio * weight
+        if now is not None:
+            hidden = [key for key in self.get_scheduled(now) if key in scores]
+            if hidden:
+                if len(terms) == 1:
+                    scores = dict(scores)
+                for key in hidden:
+                    del scores[key]
+        return scores
+
+
+def get_top(scores, count):
+    """Return keys of count best scored documents ordered by relevance."""
+    return nlargest(count, scores, key=scores.get)
+
+
+def load_posts(index, queryset):
+    modified = None
+    fields = ("pk", "search_terms", "timestamp", "modified")
+    for pk, terms, timestamp, changed in queryset.values_list(*fields).iterator():
+        index.add(pk, terms, timestamp)
+        if modified is None or changed > modified:
+            modified = changed
+    return modified
+
+
+def get_index():
+    """Return up to date search index, needs to be called with INDEX_LOCK."""
+    version = get_news_version()["tag"]
+    if INDEX["index"] is None:
+        INDEX["index"] = SearchIndex()
+        INDEX["modified"] = load_posts(INDEX["index"], Post.objects.all())
+    elif INDEX["version"] != version:
+        index = INDEX["index"]
+        posts = Post.objects.all()
+        if INDEX["modified"] is not None:
+            posts = posts.filter(modified__gte=INDEX["modified"])
+        INDEX["modified"] = load_posts(index, posts) or INDEX["modified"]
+        existing = set(Post.objects.values_list("pk", flat=True))
+        for key in set(index.documents) - existing:
+            index.remove(key)
+    INDEX["version"] = version
+    return INDEX["index"]
+
+
+def get_snippet(text, terms):
+    """Return part of text around first match with highlighted terms."""
+    if not terms:
+        return text[:SNIPPET_LENGTH]
+    regex = re.compile(
+        r"\b({})\b".format("|".join(re.escape(term) for term in terms)),
+        re.IGNORECASE,
+    )
+    start = 0
+    match = regex.search(text)
+    if match and match.start() > SNIPPET_CONTEXT:
+        start = text.find(" ", match.start() - SNIPPET_CONTEXT) + 1
+    end = start + SNIPPET_LENGTH
+    snippet = text[start:end]
+    parts = ["…"] if start else []
+    position = 0
+    for match in regex.finditer(snippet):
+        parts.append(escape(snippet[position : match.start()]))
+        parts.append("<mark>{}</mark>".format(escape(match.group())))
+        position = match.end()
+    parts.append(escape(snippet[position:]))
+    if end < len(text):
+        parts.append("…")
+    return mark_safe("".join(parts))
+
+
+class SearchResults:
+    """Search results sequence, posts are fetched only for requested slice.
+
+    This is suitable for Django paginator.
+    """
+
+    def __init__(self, query, now=None):
+        self.terms = tokenize(query)
+        with INDEX_LOCK:
+            self.scores = get_index().search(self.terms, now)
+        self.keys = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __getitem__(self, key):
+        stop = key.stop if key.stop is not None else len(self.scores)
+        if stop > len(self.keys):
+            # Cached weights are updated in place when the index changes
+            with INDEX_LOCK:
+                self.keys = get_top(self.scores, stop)
+        keys = self.keys[key]
+        posts = Post.objects.select_related("image").in_bulk(keys)
+        result = []
+        for pk in keys:
+            # Might be removed meanwhile
+            if pk not in posts:
+                continue
+            post = posts[pk]
+            post.snippet = get_snippet(
+                " ".join(get_post_text(post).split()), self.terms
+            )
+            result.append(post)
+        return result
@@ -0,0 +1,347 @@
+#
+# Copyright © 2012–2020 Michal Čihař <michal@cihar.com>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""Sitemaps and their pre-generation.
+
+The sitemaps are written to SITEMAP_PATH by the write_sitemaps
+management command and by the background_fetch scheduler whenever the
+news change (including scheduled posts being published). The web server
+can serve them directly and the dynamic views are used only as a
+fallback.
+"""
+
+import os
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from functools import lru_cache, wraps
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.sitemaps import Sitemap
+from django.http import FileResponse
+from django.template.loader import get_template
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django.utils.translation import override, to_locale
+
+from weblate_web.data import VERSION
+from weblate_web.lease import acquire_lease, release_lease
+from weblate_web.models import Post, get_news_version
+
+# Protocol limits for a single file
+SITEMAP_URLS = 50000
+SITEMAP_SIZE = 50 * 1024 * 1024
+
+SITEMAP_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+SITEMAP_FOOTER = "</urlset>\n"
+INDEX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+INDEX_FOOTER = "</sitemapindex>\n"
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+# How often the scheduler checks whether sitemaps need update
+SITEMAP_INTERVAL = 60
+SITEMAP_LEASE = "wlweb-sitemaps"
+# State of the sitemaps written by this process
+GENERATED = {"state": None}
+
+
+def get_mtime(filename):
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(filename), dt_timezone.utc)
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_page_lastmod(language, path):
+    """Return modification time of template and translations for page."""
+    try:
+        with override(language):
+            match = resolve(path)
+    except Resolver404:
+        return None
+    initkwargs = getattr(match.func, "view_initkwargs", {})
+    view_class = getattr(match.func, "view_class", None)
+    template = initkwargs.get("template_name") or getattr(
+        view_class, "template_name", None
+    )
+    if not template:
+        return None
+    times = [get_mtime(get_template(template).origin.name)]
+    locale = to_locale(language)
+    for locale_path in settings.LOCALE_PATHS:
+        times.append(
+            get_mtime(os.path.join(locale_path, locale, "LC_MESSAGES", "django.mo"))
+        )
+    times = [value for value in times if value]
+    return max(times) if times else None
+
+
+class PagesSitemap(Sitemap):
+    """Sitemap of static pages for one language."""
+
+    def __init__(self, language):
+        super().__init__()
+        self.language = language
+
+    def items(self):
+        return (
+            ("/", 1.0, "weekly"),
+            ("/features/", 0.9, "weekly"),
+            ("/download/", 0.5, "daily"),
+            ("/try/", 0.5, "weekly"),
+            ("/hosting/", 0.8, "monthly"),
+            ("/contribute/", 0.7, "monthly"),
+            ("/donate/", 0.7, "weekly"),
+            ("/careers/", 0.7, "weekly"),
+            ("/support/", 0.7, "monthly"),
+            ("/terms/", 0.2, "monthly"),
+            ("/news/", 0.9, "daily"),
+        )
+
+    def location(self, obj):
+        return "/{0}{1}".format(self.language, obj[0])
+
+    def priority(self, obj):
+        if self.language == "en":
+            return obj[1]
+        return obj[1] * 3 / 4
+
+    def changefreq(self, obj):
+        # pylint: disable=no-self-use
+        return obj[2]
+
+    def lastmod(self, obj):
+        result = get_page_lastmod(self.language, self.location(obj))
+        if obj[0] == "/news/":
+            news = get_news_version()["last_modified"]
+            if news and (result is None or news > result):
+                result = news
+        return result
+
+
+class NewsSitemap(Sitemap):
+    priority = 0.8
+
+    def items(self):
+        # pylint: disable=no-self-use
+        return Post.objects.filter(timestamp__lt=timezone.now()).order_by("-timestamp")
+
+    def lastmod(self, item):
+        # pylint: disable=no-self-use
+        return item.timestamp
+
+
+# create each section in all languages
+SITEMAPS = {lang[0]: PagesSitemap(lang[0]) for lang in settings.LANGUAGES}
+SITEMAPS["news"] = NewsSitemap()
+
+
+def get_attribute(sitemap, name, item):
+    value = getattr(sitemap, name, None)
+    if callable(value):
+        return value(item)
+    return value
+
+
+def format_entry(tag, location, lastmod=None, changefreq=None, priority=None):
+    result = ["  <{}><loc>{}</loc>".format(tag, escape(location))]
+    if lastmod:
+        result.append("<lastmod>{}</lastmod>".format(lastmod.isoformat()))
+    if changefreq:
+        result.append("<changefreq>{}</changefreq>".format(changefreq))
+    if priority is not None:
+        result.append("<priority>{}</priority>".format(priority))
+    result.append("</{}>\n".format(tag))
+    return "".join(result)
+
+
+class SitemapWriter:
+    """Streams sitemap entries to files split at the protocol limits."""
+
+    def __init__(self, path, section):
+        self.path = path
+        self.section = section
+        self.files = []
+        self.handle = None
+        self.count = 0
+        self.size = 0
+        self.lastmod = None
+
+    def get_name(self):
+        if not self.files:
+            return "sitemap-{}.xml".format(self.section)
+        return "sitemap-{}-{}.xml".format(self.section, len(self.files) + 1)
+
+    def open(self):
+        self.handle = open(
+            os.path.join(self.path, self.get_name() + ".tmp"), "w", encoding="utf-8"
+        )
+        self.handle.write(SITEMAP_HEADER)
+        self.count = 0
+        self.size = len(SITEMAP_HEADER) + len(SITEMAP_FOOTER)
+        self.lastmod = None
+
+    def close(self):
+        self.handle.write(SITEMAP_FOOTER)
+        self.handle.close()
+        name = self.get_name()
+        os.replace(
+            os.path.join(self.path, name + ".tmp"), os.path.join(self.path, name)
+        )
+        self.files.append((name, self.lastmod))
+        self.handle = None
+
+    def add(self, entry, lastmod):
+        size = len(entry.encode())
+        if self.handle is not None and (
+            self.count >= SITEMAP_URLS or self.size + size > SITEMAP_SIZE
+        ):
+            self.close()
+        if self.handle is None:
+            self.open()
+        self.handle.write(entry)
+        self.count += 1
+        self.size += size
+        if lastmod and (self.lastmod is None or lastmod > self.lastmod):
+            self.lastmod = lastmod
+
+    def finish(self):
+        if self.handle is None and not self.files:
+            # Empty sitemap is still valid
+            self.open()
+        if self.handle is not None:
+            self.close()
+        return self.files
+
+
+def write_section(path, section, sitemap):
+    """Write single sitemap section, returns list of files with lastmod."""
+    writer = SitemapWriter(path, section)
+    items = sitemap.items()
+    if hasattr(items, "iterator"):
+        items = items.iterator()
+    for item in items:
+        lastmod = get_attribute(sitemap, "lastmod", item)
+        writer.add(
+            format_entry(
+                "url",
+                settings.SITE_URL + get_attribute(sitemap, "location", item),
+                lastmod,
+                get_attribute(sitemap, "changefreq", item),
+                get_attribute(sitemap, "priority", item),
+            ),
+            lastmod,
+        )
+    return writer.finish()
+
+
+def write_sitemaps(path=None, sitemaps=None):
+    """Write sitemap index and all sections, returns list of written files."""
+    if path is None:
+        path = settings.SITEMAP_PATH
+    if sitemaps is None:
+        sitemaps = SITEMAPS
+    os.makedirs(path, exist_ok=True)
+    previous = get_index_files(path)
+
+    files = []
+    with override("en"):
+        for section, sitemap in sitemaps.items():
+            files.extend(write_section(path, section, sitemap))
+
+    temp = os.path.join(path, "sitemap.xml.tmp")
+    with open(temp, "w", encoding="utf-8") as handle:
+        handle.write(INDEX_HEADER)
+        for name, lastmod in files:
+            handle.write(
+                format_entry(
+                    "sitemap", "{}/{}".format(settings.SITE_URL, name), lastmod
+                )
+            )
+        handle.write(INDEX_FOOTER)
+    os.replace(temp, os.path.join(path, "sitemap.xml"))
+
+    # Remove no longer needed files, for example after the split changed
+    current = {name for name, lastmod in files}
+    for name in previous - current:
+        try:
+            os.unlink(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+    return ["sitemap.xml"] + sorted(current)
+
+
+def get_index_files(path):
+    """Return names of the files listed in existing sitemap index."""
+    try:
+        tree = ElementTree.parse(os.path.join(path, "sitemap.xml"))
+    except (OSError, ElementTree.ParseError):
+        return set()
+    result = set()
+    for location in tree.iter(SITEMAP_NS + "loc"):
+        name = location.text.rsplit("/", 1)[-1]
+        # Only files written by write_sitemaps
+        if name.startswith("sitemap-") and name.endswith(".xml"):
+            result.add(name)
+    return result
+
+
+def update_sitemaps():
+    """Write sitemaps if the news changed since the last run."""
+    if not os.path.isdir(settings.SITEMAP_PATH):
+        return None
+    state = "{}:{}".format(VERSION, get_news_version()["tag"])
+    if GENERATED["state"] == state:
+        return None
+    token = acquire_lease(SITEMAP_LEASE)
+    if token is None:
+        return None
+    try:
+        write_sitemaps()
+    finally:
+        release_lease(SITEMAP_LEASE, token)
+    GENERATED["state"] = state
+    return True
+
+
+def pregenerated_sitemap(view):
+    """Serve pre-generated sitemap file if available, fallback to the view."""
+
+    @wraps(view)
+    def serve(request, section=None, **kwargs):
+        if section is None:
+            name = "sitemap.xml"
+        else:
+            name = "sitemap-{}.xml".format(section)
+        filename = os.path.join(settings.SITEMAP_PATH, name)
+        if "/" not in name and os.path.exists(filename):
+            return FileResponse(open(filename, "rb"), content_type="application/xml")
+        if section is None:
+            return view(request, **kwargs)
+        return view(request, section=section, **kwargs)
+
+    return serve
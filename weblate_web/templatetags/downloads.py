@@ -24,6 +24,8 @@ from django.template import Library
 from django.utils.translation import ugettext as _
 from django.utils.translation import ungettext
 
+from weblate_web.releases import get_release_info
+
 register = Library()
 
 
@@ -59,13 +61,12 @@ def downloadlink(name, text=None):
         else:
             text = os.path.split(name)[1]
 
-    filesize = os.path.getsize(os.path.join(settings.FILES_PATH, name))
-
-    size = filesizeformat(filesize)
+    info = get_release_info(name)
 
     return {
         "base": settings.FILES_URL,
         "name": name,
         "text": text,
-        "size": size,
+        "size": filesizeformat(info["size"]) if info else None,
+        "sha256": info["sha256"] if info else None,
     }
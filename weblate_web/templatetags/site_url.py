@@ -18,30 +18,58 @@
 #
 """Provide user friendly names for social authentication methods."""
 
-from io import StringIO
+import re
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
 
 from django import template
+from django.conf import settings
 from django.utils.safestring import mark_safe
-from lxml import etree
 
 register = template.Library()
 
+# Start tags of links and images
+TAG_RE = re.compile(r"<(a|img)\b[^>]*>", re.IGNORECASE)
+# Link attributes with a site relative URL (but not //host/ URLs)
+ATTR_RE = {
+    "a": re.compile(r"""(\shref\s*=\s*["']?)(/(?!/))""", re.IGNORECASE),
+    "img": re.compile(r"""(\ssrc\s*=\s*["']?)(/(?!/))""", re.IGNORECASE),
+}
+
+CACHE_SIZE = 128
+CACHE = OrderedDict()
+CACHE_LOCK = Lock()
+
+
+def rewrite_tag(match):
+    return ATTR_RE[match.group(1).lower()].sub(
+        r"\g<1>{}\g<2>".format(settings.SITE_URL), match.group(0), count=1
+    )
+
+
+def rewrite_links(content):
+    """Prefix site relative links and images with site URL.
+
+    Only start tags of links and images are touched, rest of the content
+    is passed unchanged.
+    """
+    return TAG_RE.sub(rewrite_tag, content)
+
 
 @register.filter
 def add_site_url(content):
     """Automatically add site URL to any relative links or images."""
-    parser = etree.HTMLParser()
-    tree = etree.parse(StringIO(content), parser)
-    for link in tree.findall("//a"):
-        url = link.get("href")
-        if url.startswith("/"):
-            link.set("href", "https://weblate.org" + url)
-    for link in tree.findall("//img"):
-        url = link.get("src")
-        if url.startswith("/"):
-            link.set("src", "https://weblate.org" + url)
-    return mark_safe(
-        etree.tostring(
-            tree.getroot(), pretty_print=True, method="html", encoding="unicode"
-        )
-    )
+    # Same content is typically rendered many times (for example in the
+    # notifications) so the result is cached
+    key = sha1(content.encode()).digest()
+    with CACHE_LOCK:
+        if key in CACHE:
+            CACHE.move_to_end(key)
+            return mark_safe(CACHE[key])
+    result = rewrite_links(content)
+    with CACHE_LOCK:
+        CACHE[key] = result
+        if len(CACHE) > CACHE_SIZE:
+            CACHE.popitem(last=False)
+    return mark_safe(result)
@@ -1,7 +1,13 @@
+import json
 import os
 import shutil
 import tempfile
+import time
 from datetime import date, timedelta
+from io import StringIO
+from unittest.mock import patch
+from urllib.parse import urlparse
+from uuid import uuid4
 from xml.etree import ElementTree
 
 import requests
@@ -11,25 +17,60 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.management import call_command
+from django.core.paginator import Paginator
 from django.core.signing import dumps
-from django.test import TestCase
+from django.test import Client, TestCase
 from django.test.utils import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import override
+from django.views.generic import TemplateView
 
+import outbound
 from payments.data import SUPPORTED_LANGUAGES
 from payments.models import Customer, Payment
 
+from .context_processors import get_context_usage, get_language_urls
 from .data import EXTENSIONS, VERSION
-from .models import PAYMENTS_ORIGIN, Donation, Package, Post, Service
+from .export import export_site, get_pages
+from .lease import acquire_lease, release_lease
+from .middleware import CSP
+from .models import (
+    NEWS_VERSION_KEY,
+    PAYMENTS_ORIGIN,
+    RELATED_CHANGED_KEY,
+    Donation,
+    Package,
+    Post,
+    QueuedReport,
+    RemoteData,
+    Report,
+    ReportRollup,
+    Service,
+    Subscription,
+    get_news_version,
+    get_service_status,
+)
+from .pagecache import bump_content_version
+from .related import update_changed_related
 from .remote import (
     ACTIVITY_URL,
+    REMOTE_TIMEOUT,
     WEBLATE_CONTRIBUTORS_URL,
     get_activity,
+    get_changes,
     get_contributors,
+    get_counters,
+    rank_contributor,
+    store_remote,
 )
+from .reports import compact_reports, provision_backups
+from .scheduler import Job, Scheduler, get_status
+from .search import SearchIndex, get_top
+from .sitemaps import update_sitemaps, write_sitemaps
 from .templatetags.downloads import downloadlink, filesizeformat
+from .templatetags.site_url import add_site_url
+from .views import get_elided_page_range
 
 TEST_DATA = os.path.join(os.path.dirname(__file__), "test-data")
 TEST_FAKTURACE = os.path.join(TEST_DATA, "fakturace")
@@ -59,9 +100,9 @@ def fake_remote():
             "address": "Zdiměřická 1439/8\nPRAHA 11 - CHODOV\n149 00  PRAHA 415",
         },
     )
-    cache.set("wlweb-contributors", [])
-    cache.set("wlweb-activity-stats", [])
-    cache.set(
+    store_remote("wlweb-contributors", [])
+    store_remote("wlweb-activity-stats", [])
+    store_remote(
         "wlweb-changes-list",
         [
             {
@@ -230,6 +271,142 @@ class ViewTestCase(PostTestCase):
         self.assertRedirects(response, "/.well-known/security.txt", status_code=301)
         self.assertContains(response, "https://hackerone.com/weblate")
 
+    def test_language_urls(self):
+        get_language_urls.cache_clear()
+        response = self.client.get("/cs/features/")
+        self.assertContains(response, 'href="/he/features/"')
+        self.assertEqual(response.context["canonical_url"](), "/features/")
+        response = self.client.get("/de/features/")
+        self.assertContains(response, 'href="/he/features/"')
+        info = get_language_urls.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 1)
+
+    def test_context_usage(self):
+        self.client.get("/en/")
+        self.client.get("/.well-known/security.txt")
+        usage = get_context_usage()
+        self.assertIn("activity_sum", usage["index.html"]["keys"])
+        self.assertNotIn("downloads", usage["index.html"]["keys"])
+        self.assertEqual(usage["security.txt"]["keys"], {})
+        output = StringIO()
+        call_command("context_usage", "/en/about/", stdout=output)
+        self.assertIn("contributors", output.getvalue())
+
+    def test_page_cache(self):
+        response = self.client.get("/en/features/")
+        self.assertContains(response, "Weblate")
+        with patch.object(
+            TemplateView,
+            "get_context_data",
+            autospec=True,
+            side_effect=TemplateView.get_context_data,
+        ) as context:
+            # Served from the cache
+            response = self.client.get("/en/features/")
+            self.assertContains(response, "Weblate")
+            # Unused query parameters do not create another entry
+            response = self.client.get("/en/features/?utm_source=test")
+            self.assertContains(response, "Weblate")
+            context.assert_not_called()
+            self.assertIn("Content-Language", response)
+            # Content change invalidates the cache
+            bump_content_version()
+            self.client.get("/en/features/")
+            context.assert_called_once()
+
+    def test_page_cache_context(self):
+        self.client.get("/en/about/")
+        before = get_context_usage()["about.html"]
+        with patch("weblate_web.context_processors.get_contributors") as contributors:
+            self.client.get("/en/about/")
+            # Remote data used by the page is checked on cache hit as well
+            contributors.assert_called_once()
+        after = get_context_usage()["about.html"]
+        self.assertEqual(after["renders"], before["renders"] + 1)
+        self.assertEqual(
+            after["keys"]["contributors"], before["keys"]["contributors"] + 1
+        )
+
+    def test_page_cache_bypass(self):
+        self.client.get("/en/features/")
+        User.objects.create_user(username="testuser", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+        with patch.object(
+            TemplateView,
+            "get_context_data",
+            autospec=True,
+            side_effect=TemplateView.get_context_data,
+        ) as context:
+            self.client.get("/en/features/")
+            context.assert_called_once()
+
+    @override_settings(LANGUAGES=(("en", "English"), ("cs", "Čeština")))
+    def test_export_static(self):
+        post = self.create_post()
+        output = tempfile.mkdtemp()
+        try:
+            stderr = StringIO()
+            call_command(
+                "export_static", output, jobs=1, stdout=StringIO(), stderr=stderr
+            )
+            with open(os.path.join(output, "manifest.json")) as handle:
+                pages = json.load(handle)["pages"]
+            self.assertIn("/cs/features/", pages)
+            # Pages with CSRF token are specific to the user
+            self.assertNotIn("/en/support/", pages)
+            self.assertIn("/en/support/: not exported", stderr.getvalue())
+            skipped = ["/en/try/", "/en/support/", "/cs/try/", "/cs/support/"]
+            self.assertIn("/en/news/archive/testpost/", pages)
+            page = pages["/cs/features/"]
+            self.assertIn("gzip", page["encodings"])
+            with open(os.path.join(output, "cs", "features", "index.html")) as handle:
+                self.assertIn("Weblate", handle.read())
+            self.assertTrue(os.path.exists(os.path.join(output, page["file"])))
+
+            # Nothing changed
+            self.assertEqual(export_site(output), (0, len(pages), 0, skipped))
+
+            # Only the post and news pages are rendered
+            post.title = "Changed post"
+            post.save()
+            self.assertEqual(export_site(output), (4, len(pages) - 4, 0, skipped))
+
+            # Removed post, the news index is empty now as well
+            post.delete()
+            rendered, unchanged, removed, skipped = export_site(output)
+            self.assertEqual(removed, 4)
+            self.assertFalse(
+                os.path.exists(
+                    os.path.join(output, "en", "news", "archive", "testpost")
+                    + "/index.html"
+                )
+            )
+        finally:
+            shutil.rmtree(output)
+
+    @override_settings(LANGUAGES=(("en", "English"),))
+    def test_export_related(self):
+        first = self.create_post("first")
+        second = self.create_post("second")
+        Post.objects.filter(pk=first.pk).update(topic="release", related=[second.pk])
+        Post.objects.filter(pk=second.pk).update(topic="conferences")
+        url = "/en/news/archive/first/"
+        fingerprint = dict(get_pages())[url]
+        # Change of related post in other topic changes the page
+        Post.objects.filter(pk=second.pk).update(title="Changed")
+        self.assertNotEqual(dict(get_pages())[url], fingerprint)
+
+    @override_settings(DEBUG=False)
+    def test_security_headers(self):
+        response = self.client.get("/en/features/")
+        self.assertEqual(response["Content-Security-Policy"], CSP)
+        self.assertIn("hosted.weblate.org", response["Content-Security-Policy"])
+        self.assertIn("report-uri", response["Expect-CT"])
+
+    def test_benchmark(self):
+        call_command("benchmark", "context", number=1, stdout=StringIO())
+
     @responses.activate
     def test_about(self):
         with open(TEST_CONTRIBUTORS) as handle:
@@ -255,6 +432,18 @@ class ViewTestCase(PostTestCase):
         get_activity(force=True)
         response = self.client.get("/img/activity.svg")
         self.assertContains(response, "<svg")
+        # Conditional request
+        etag = response["ETag"]
+        response = self.client.get("/img/activity.svg", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        # Changed data
+        store_remote("wlweb-activity-stats", [1, 2, 3])
+        response = self.client.get("/img/activity.svg", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, 'id="b2"')
+        self.assertNotContains(response, 'id="b3"')
 
     def test_download_en(self):
         # create dummy files for testing
@@ -300,6 +489,274 @@ class ViewTestCase(PostTestCase):
             # Try if it's a valid XML
             ElementTree.fromstring(response.content)
 
+    def test_sitemaps_pregenerated(self):
+        self.create_post()
+        self.create_post("otherpost")
+        output = tempfile.mkdtemp()
+        try:
+            with override_settings(SITEMAP_PATH=output), patch(
+                "weblate_web.sitemaps.SITEMAP_URLS", 1
+            ):
+                call_command("write_sitemaps", stdout=StringIO())
+                self.assertTrue(
+                    os.path.exists(os.path.join(output, "sitemap-news-2.xml"))
+                )
+                response = self.client.get("/sitemap.xml")
+                content = b"".join(response.streaming_content)
+                self.assertIn(b"https://weblate.org/sitemap-news-2.xml", content)
+                response = self.client.get("/sitemap-cs.xml")
+                content = b"".join(response.streaming_content)
+                self.assertIn(b"https://weblate.org/cs/</loc>", content)
+                self.assertIn(b"<lastmod>", content)
+                # Stale split files are removed, other files are kept
+                custom = os.path.join(output, "sitemap-custom.xml")
+                with open(custom, "w") as handle:
+                    handle.write("<urlset />")
+                Post.objects.filter(slug="otherpost").delete()
+                write_sitemaps()
+                self.assertFalse(
+                    os.path.exists(os.path.join(output, "sitemap-news-2.xml"))
+                )
+                self.assertTrue(os.path.exists(custom))
+        finally:
+            shutil.rmtree(output)
+
+    def test_sitemaps_update(self):
+        output = tempfile.mkdtemp()
+        try:
+            with override_settings(SITEMAP_PATH=output), patch.dict(
+                "weblate_web.sitemaps.GENERATED", {"state": None}
+            ):
+                self.assertTrue(update_sitemaps())
+                # Nothing changed
+                self.assertIsNone(update_sitemaps())
+                post = self.create_post(timestamp=timezone.now() + timedelta(days=1))
+                # Scheduled post is not listed until it is published
+                self.assertTrue(update_sitemaps())
+                news = os.path.join(output, "sitemap-news.xml")
+                with open(news) as handle:
+                    self.assertNotIn("testpost", handle.read())
+                Post.objects.filter(pk=post.pk).update(
+                    timestamp=timezone.now() - timedelta(days=1)
+                )
+                # The news version expires when the post is published
+                cache.delete(NEWS_VERSION_KEY)
+                self.assertTrue(update_sitemaps())
+                with open(news) as handle:
+                    self.assertIn("testpost", handle.read())
+        finally:
+            shutil.rmtree(output)
+
+
+class RemoteTestCase(TestCase):
+    """Remote data caching testing."""
+
+    def setUp(self):
+        super().setUp()
+        cache.delete_many(["wlweb-activity-stats", "wlweb-changes-list"])
+
+    @patch("weblate_web.remote.schedule_refresh")
+    def test_cold(self, schedule_refresh):
+        self.assertEqual(get_activity(), [])
+        schedule_refresh.assert_called_once()
+
+    @patch("weblate_web.remote.schedule_refresh")
+    def test_stale(self, schedule_refresh):
+        cache.set(
+            "wlweb-activity-stats",
+            {"data": [1, 2], "updated": time.time() - REMOTE_TIMEOUT - 1},
+        )
+        self.assertEqual(get_activity(), [1, 2])
+        schedule_refresh.assert_called_once()
+
+    @patch("weblate_web.remote.schedule_refresh")
+    def test_fresh(self, schedule_refresh):
+        store_remote("wlweb-activity-stats", [1, 2])
+        self.assertEqual(get_activity(), [1, 2])
+        schedule_refresh.assert_not_called()
+
+    @patch("weblate_web.remote.schedule_refresh")
+    def test_persistent(self, schedule_refresh):
+        now = timezone.now().replace(microsecond=0)
+        store_remote("wlweb-changes-list", [{"last_change": now}])
+        cache.delete("wlweb-changes-list")
+        self.assertEqual(get_changes(), [{"last_change": now}])
+        schedule_refresh.assert_not_called()
+
+    @patch("weblate_web.remote.schedule_refresh")
+    def test_legacy(self, schedule_refresh):
+        # Data cached by older versions without timestamp
+        cache.set("wlweb-activity-stats", [1, 2, 3])
+        self.assertEqual(get_activity(), [])
+        schedule_refresh.assert_called_once()
+        store_remote("wlweb-activity-stats", [1, 2])
+        self.assertEqual(get_activity(), [1, 2])
+
+    @patch("weblate_web.remote.schedule_refresh")
+    def test_counters(self, schedule_refresh):
+        before = get_counters("wlweb-activity-stats")
+        get_activity()
+        store_remote("wlweb-activity-stats", [1, 2])
+        get_activity()
+        after = get_counters("wlweb-activity-stats")
+        self.assertEqual(after["miss"], before["miss"] + 1)
+        self.assertEqual(after["hit"], before["hit"] + 1)
+
+    @responses.activate
+    @patch("weblate_web.remote.LEASE_WAIT", 0)
+    def test_lease(self):
+        responses.add(responses.GET, ACTIVITY_URL, body="[1, 2, 3]")
+        store_remote("wlweb-activity-stats", [1, 2])
+        token = acquire_lease("wlweb-activity-stats")
+        self.assertIsNotNone(token)
+        self.assertIsNone(acquire_lease("wlweb-activity-stats"))
+        # Other process holds the lease, stale data is served
+        self.assertEqual(get_activity(force=True), [1, 2])
+        self.assertEqual(len(responses.calls), 0)
+        release_lease("wlweb-activity-stats", token)
+        self.assertEqual(get_activity(force=True), [1, 2, 3])
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_changes(self):
+        api = settings.CHANGES_API
+        names = ("first", "second", "third", "fourth")
+        responses.add(
+            responses.GET,
+            api + "projects/",
+            json={
+                "next": None,
+                "results": [
+                    {
+                        "name": name,
+                        "slug": name,
+                        "url": "{}projects/{}/".format(api, name),
+                        "statistics_url": "{}projects/{}/statistics/".format(api, name),
+                    }
+                    for name in names
+                ],
+            },
+        )
+        for offset, name in enumerate(names):
+            responses.add(
+                responses.GET,
+                "{}projects/{}/statistics/".format(api, name),
+                json={
+                    "name": name,
+                    "url": name,
+                    "last_change": "2020-10-0{}T10:00:00Z".format(offset + 1),
+                },
+            )
+        host = urlparse(api).netloc
+        before = outbound.get_metrics().get(host, {"count": 0})["count"]
+        self.assertEqual(
+            [item["name"] for item in get_changes(force=True)],
+            ["fourth", "third", "second", "first"],
+        )
+        # Requests go through the shared outbound client
+        self.assertEqual(outbound.get_metrics()[host]["count"], before + 5)
+        # Failing projects are kept from the previous data
+        responses.replace(responses.GET, api + "projects/third/statistics/", status=500)
+        responses.replace(
+            responses.GET, api + "projects/fourth/statistics/", body=IOError()
+        )
+        self.assertEqual(
+            [item["name"] for item in get_changes(force=True)],
+            ["fourth", "third", "second", "first"],
+        )
+
+    @responses.activate
+    def test_contributors_etag(self):
+        with open(TEST_CONTRIBUTORS) as handle:
+            body = handle.read()
+        responses.add(
+            responses.GET,
+            WEBLATE_CONTRIBUTORS_URL,
+            body=body,
+            headers={"ETag": '"test"'},
+        )
+        contributors = get_contributors(force=True)
+        self.assertEqual(len(contributors), 8)
+        self.assertNotIn("weeks", contributors[0])
+        responses.replace(responses.GET, WEBLATE_CONTRIBUTORS_URL, status=304)
+        self.assertEqual(get_contributors(force=True), contributors)
+        self.assertEqual(responses.calls[1].request.headers["If-None-Match"], '"test"')
+
+    def test_rank_incremental(self):
+        with open(TEST_CONTRIBUTORS) as handle:
+            stat = json.load(handle)[0]
+        rank, snapshot = rank_contributor(stat)
+        self.assertEqual(
+            rank, stat["total"] + sum(week["a"] + week["d"] for week in stat["weeks"])
+        )
+        # Current week has changed and new week was added
+        stat["total"] += 2
+        stat["weeks"][-1]["a"] += 10
+        stat["weeks"].append({"w": stat["weeks"][-1]["w"] + 604800, "a": 1, "d": 2})
+        self.assertEqual(
+            rank_contributor(stat, snapshot)[0],
+            rank_contributor(stat)[0],
+        )
+        self.assertEqual(rank_contributor(stat, snapshot)[0], rank + 15)
+
+    @responses.activate
+    def test_failure(self):
+        responses.add(responses.GET, ACTIVITY_URL, status=202)
+        self.assertEqual(get_activity(force=True), [])
+        self.assertFalse(RemoteData.objects.exists())
+        store_remote("wlweb-activity-stats", [1, 2])
+        cache.delete("wlweb-activity-stats")
+        self.assertEqual(get_activity(force=True), [1, 2])
+
+
+class SchedulerTestCase(TestCase):
+    """Background jobs testing."""
+
+    def test_backoff(self):
+        job = Job("test", lambda: False, 3600, jitter=0, backoff=60)
+        self.assertEqual(job.get_delay(), 3600)
+        job.failures = 1
+        self.assertEqual(job.get_delay(), 60)
+        job.failures = 3
+        self.assertEqual(job.get_delay(), 240)
+        job.failures = 10
+        self.assertEqual(job.get_delay(), 3600)
+
+    def test_run(self):
+        calls = []
+
+        def failing():
+            calls.append("fail")
+            raise IOError("Upstream failure")
+
+        scheduler = Scheduler(
+            [
+                Job("ok", lambda: calls.append("ok") or True, 3600),
+                Job("fail", failing, 3600),
+                Job("skip", lambda: None, 3600),
+            ]
+        )
+        for future in scheduler.run_pending():
+            future.result()
+        self.assertEqual(sorted(calls), ["fail", "ok"])
+        # Nothing is due now
+        self.assertEqual(scheduler.run_pending(), [])
+        scheduler.executor.shutdown()
+
+        status = get_status()
+        self.assertIsNotNone(status["ok"]["last_success"])
+        self.assertIsNone(status["fail"]["last_success"])
+        self.assertEqual(status["fail"]["failures"], 1)
+        self.assertEqual(status["fail"]["last_error"], "Upstream failure")
+        self.assertEqual(status["skip"]["failures"], 0)
+
+    def test_running(self):
+        job = Job("test", lambda: True, 3600)
+        job.running = True
+        scheduler = Scheduler([job])
+        self.assertEqual(scheduler.run_pending(), [])
+        scheduler.executor.shutdown()
+
 
 class UtilTestCase(TestCase):
     """Helper code testing."""
@@ -326,6 +783,79 @@ class UtilTestCase(TestCase):
         self.assertEqual("0 bytes", downloadlink("foo.pdf")["size"])
         self.assertEqual("0 bytes", downloadlink("foo.pdf", "text")["size"])
         self.assertEqual("text", downloadlink("foo.pdf", "text")["text"])
+        self.assertIsNone(downloadlink("missing.tar.xz")["size"])
+
+    def test_release_manifest(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            with override_settings(FILES_PATH=temp_dir):
+                name = "Weblate-{0}.{1}".format(VERSION, EXTENSIONS[0])
+                missing = "Weblate-{0}.{1}".format(VERSION, EXTENSIONS[1])
+                # Missing files do not break rendering
+                self.assertIsNone(downloadlink(missing)["size"])
+                with open(os.path.join(temp_dir, name), "w") as handle:
+                    handle.write("test")
+                # Files are not hashed while rendering
+                with patch("weblate_web.releases.sha256") as digest:
+                    link = downloadlink(name)
+                    digest.assert_not_called()
+                self.assertEqual(link["size"], "4 bytes")
+                self.assertIsNone(link["sha256"])
+                # Files not in the manifest are looked up only once
+                with patch("os.stat") as stat:
+                    self.assertEqual(downloadlink(name)["size"], "4 bytes")
+                    self.assertIsNone(downloadlink(missing)["size"])
+                    stat.assert_not_called()
+                self.assertFalse(
+                    os.path.exists(os.path.join(temp_dir, "manifest.json"))
+                )
+                call_command(
+                    "update_files_manifest", stdout=StringIO(), stderr=StringIO()
+                )
+                with open(os.path.join(temp_dir, "manifest.json")) as handle:
+                    manifest = json.load(handle)
+                self.assertEqual(manifest["version"], VERSION)
+                self.assertEqual(manifest["files"][name]["size"], 4)
+                # Manifest is reloaded after a change
+                with patch("weblate_web.releases.MANIFEST_REFRESH", -1):
+                    link = downloadlink(name)
+                self.assertEqual(link["size"], "4 bytes")
+                self.assertEqual(
+                    link["sha256"],
+                    "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+                )
+                # No filesystem access once loaded
+                with patch("os.stat") as stat:
+                    downloadlink(name)
+                    stat.assert_not_called()
+                # Manifest for other version is outdated
+                manifest["version"] = "0.1"
+                with open(os.path.join(temp_dir, "manifest.json"), "w") as handle:
+                    json.dump(manifest, handle)
+                os.utime(os.path.join(temp_dir, "manifest.json"), (0, 0))
+                with patch("weblate_web.releases.MANIFEST_REFRESH", -1):
+                    link = downloadlink(name)
+                self.assertEqual(link["size"], "4 bytes")
+                self.assertIsNone(link["sha256"])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_add_site_url(self):
+        content = (
+            '<p><a href="/en/donate/">Donate</a> <A class="x" HREF=\'/news/\'>'
+            '<img src="/static/logo.png" /> <img src="cid:logo.png" />'
+            '<a href="//example.com/">x</a> <a>y</a> href="/text/"</p>'
+        )
+        expected = (
+            '<p><a href="https://weblate.org/en/donate/">Donate</a> '
+            "<A class=\"x\" HREF='https://weblate.org/news/'>"
+            '<img src="https://weblate.org/static/logo.png" /> '
+            '<img src="cid:logo.png" />'
+            '<a href="//example.com/">x</a> <a>y</a> href="/text/"</p>'
+        )
+        self.assertEqual(add_site_url(content), expected)
+        # Cached result
+        self.assertEqual(add_site_url(content), expected)
 
 
 class FakturaceTestCase(TestCase):
@@ -394,6 +924,18 @@ class PaymentsTest(FakturaceTestCase):
         )
         self.check_payment(payment, Payment.ACCEPTED)
 
+    @override_settings(PAYMENT_DEBUG=True)
+    def test_csrf_secret(self):
+        client = Client(enforce_csrf_checks=True)
+        payment = "/en/payment/{}/".format(uuid4())
+        response = client.post(payment, {"secret": settings.PAYMENT_SECRET})
+        self.assertEqual(response.status_code, 404)
+        response = client.post(payment, {"secret": "invalid"})
+        self.assertEqual(response.status_code, 403)
+        # Secret is accepted only on the payment URLs
+        response = client.post("/en/support/", {"secret": settings.PAYMENT_SECRET})
+        self.assertEqual(response.status_code, 403)
+
     @override_settings(PAYMENT_DEBUG=True, PAYMENT_FAKTURACE=TEST_FAKTURACE)
     def test_invalid_vat(self):
         payment, url, customer_url = self.test_view()
@@ -461,6 +1003,33 @@ class DonationTest(FakturaceTestCase):
         response = self.client.get("/en/donate/new/")
         self.assertContains(response, "list of supporters")
 
+    def test_supporters(self):
+        user = self.create_user()
+        donation = Donation.objects.create(
+            user=user,
+            reward=3,
+            link_text="Supporter Inc.",
+            link_url="https://example.com/",
+            expires=timezone.now() + timedelta(days=1),
+            active=True,
+        )
+        response = self.client.get("/en/donate/")
+        self.assertContains(response, "Supporter Inc.")
+        # Cached list, no database access needed
+        with self.assertNumQueries(0):
+            response = self.client.get("/en/donate/")
+        self.assertContains(response, "Supporter Inc.")
+        # Invalidated on save
+        donation.link_text = "Renamed Inc."
+        donation.save()
+        response = self.client.get("/en/donate/")
+        self.assertContains(response, "Renamed Inc.")
+        # Invalidated by expiry
+        Donation.objects.update(expires=timezone.now() - timedelta(days=1))
+        call_command("process_payments")
+        response = self.client.get("/en/donate/")
+        self.assertNotContains(response, "Renamed Inc.")
+
     @override_settings(PAYMENT_FAKTURACE=TEST_FAKTURACE)
     def test_service_workflow_card(self):
         self.login()
@@ -670,6 +1239,149 @@ class PostTest(PostTestCase):
         response = self.client.get(future.get_absolute_url(), follow=True)
         self.assertEqual(response.status_code, 404)
 
+    def test_related(self):
+        first = self.create_post("first", "Translation memory improvements")
+        second = self.create_post("second", "Faster translation memory lookups")
+        third = self.create_post("third", "Weblate conference")
+        future = self.create_post(
+            "future", "Translation memory news", timezone.now() + timedelta(days=1)
+        )
+        with override("en"):
+            url = first.get_absolute_url()
+        # Not yet computed index falls back to the topic
+        response = self.client.get(url)
+        self.assertEqual(list(response.context["related"]), [third, second])
+        etag = response["ETag"]
+        call_command("update_related_posts", stdout=StringIO())
+        first.refresh_from_db()
+        self.assertEqual(set(first.related[:2]), {second.pk, future.pk})
+        self.assertIn(third.pk, first.related)
+        # Changed index is not served as not modified
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        related = list(response.context["related"])
+        self.assertEqual(related, [second, third])
+        # Changed posts are picked up by the scheduler
+        cache.delete(RELATED_CHANGED_KEY)
+        Post.objects.filter(pk=first.pk).update(related=[])
+        first.summary = "Summary"
+        first.save(update_fields=["summary"])
+        self.assertIsNone(update_changed_related())
+        third.title = "Translation memory conference"
+        third.save()
+        self.assertTrue(update_changed_related())
+        first.refresh_from_db()
+        self.assertEqual(set(first.related), {second.pk, third.pk, future.pk})
+        # Failed update is retried
+        third.save()
+        with patch(
+            "weblate_web.related.update_related_posts", side_effect=OSError
+        ), self.assertRaises(OSError):
+            update_changed_related()
+        self.assertTrue(cache.get(RELATED_CHANGED_KEY))
+
+    def test_search(self):
+        first = self.create_post("first", "Translation memory improvements")
+        second = self.create_post("second", "Weblate <b>translation</b> conference")
+        self.create_post(
+            "future", "Translation memory news", timezone.now() + timedelta(days=1)
+        )
+        response = self.client.get("/en/news/search/", {"q": "Translation memory"})
+        self.assertEqual(list(response.context["object_list"]), [first, second])
+        self.assertContains(response, "<mark>Translation</mark> <mark>memory</mark>")
+        self.assertNotContains(response, "future")
+        # Index is updated on change
+        second.body = "Translation memory everywhere, translation memory always"
+        second.save()
+        first.delete()
+        response = self.client.get("/en/news/search/", {"q": "memory"})
+        self.assertEqual(list(response.context["object_list"]), [second])
+        response = self.client.get("/en/news/search/", {"q": "nonexisting"})
+        self.assertContains(response, "No matching posts found.")
+
+    def test_search_index(self):
+        index = SearchIndex()
+        for key in range(1500):
+            index.add(key, {"word": 1 + key % 3, "other": 1}, key)
+        # All matches are scored, not yet published are skipped
+        scores = index.search(["word", "missing"], now=1200)
+        self.assertEqual(len(scores), 1200)
+        self.assertEqual(get_top(scores, 3), [2, 5, 8])
+        index.remove(2)
+        self.assertEqual(get_top(index.search(["word"], now=1200), 2), [5, 8])
+        # Cached weights are updated with the index
+        index.add(1500, {"word": 3}, 0)
+        self.assertEqual(get_top(index.search(["word"]), 2), [1500, 5])
+        self.assertEqual(get_top(index.search(["word", "other"]), 2), [0, 3])
+
+    def test_search_pages(self):
+        paginator = Paginator(range(1000), 10)
+        self.assertEqual(
+            get_elided_page_range(paginator.page(50)),
+            [1, 2, None, 47, 48, 49, 50, 51, 52, 53, None, 99, 100],
+        )
+        self.assertEqual(
+            get_elided_page_range(paginator.page(1)),
+            [1, 2, 3, 4, None, 99, 100],
+        )
+
+    def test_archive_keyset(self):
+        now = timezone.now()
+        posts = [
+            self.create_post("post{}".format(i), "body", now - timedelta(hours=i))
+            for i in range(1, 13)
+        ]
+        # Same timestamp is ordered by primary key
+        posts.append(self.create_post("post13", "body", posts[-1].timestamp))
+        response = self.client.get("/en/news/archive/")
+        page = response.context["page_obj"]
+        self.assertEqual(list(page), posts[:10])
+        self.assertEqual(page.count, 13)
+        self.assertIsNone(page.newer)
+        # Count and date list are cached, only the posts are fetched
+        with self.assertNumQueries(1):
+            response = self.client.get("/en/news/archive/", {"before": page.older})
+        page = response.context["page_obj"]
+        self.assertEqual(list(page), [posts[10], posts[12], posts[11]])
+        self.assertIsNone(page.older)
+        response = self.client.get("/en/news/archive/", {"after": page.newer})
+        self.assertEqual(list(response.context["page_obj"]), posts[:10])
+        self.assertIsNone(response.context["page_obj"].newer)
+        response = self.client.get("/en/news/archive/", {"before": "invalid"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional(self):
+        post = self.create_post()
+        with override("en"):
+            post_url = post.get_absolute_url()
+        for url in ("/en/news/", post_url, "/feed/"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+            self.assertIn("Last-Modified", response)
+            # Unchanged content is answered without database queries
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+            )
+            self.assertEqual(response.status_code, 304)
+        # Changed post invalidates the ETag
+        post.title = "Changed"
+        post.save()
+        response = self.client.get("/feed/", HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Changed")
+
+    def test_news_version_scheduled(self):
+        self.create_post("futurepost", "body", timezone.now() + timedelta(seconds=30))
+        with patch.object(cache, "set", wraps=cache.set) as cache_set:
+            version = get_news_version()
+        # Nothing published yet
+        self.assertEqual(version["tag"].split(":")[1], "")
+        # Cached only until the post is published
+        self.assertLessEqual(cache_set.call_args[0][2], 31)
+
 
 class APITest(TestCase):
     databases = "__all__"
@@ -698,6 +1410,36 @@ class APITest(TestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_hosted_payments(self):
+        customer = Customer.objects.create(
+            email="weblate@example.com", user_id=1, origin=PAYMENTS_ORIGIN
+        )
+        payments = [
+            Payment.objects.create(
+                customer=customer,
+                amount=100,
+                description="Hosted",
+                end=timezone.now().date() + timedelta(days=days),
+                extra={"billing": 42},
+            )
+            for days in (-30, 0)
+        ]
+        Payment.objects.create(
+            customer=customer, amount=100, description="Other", extra={"billing": 1}
+        )
+        self.assertEqual(payments[0].hosted_billing, 42)
+        # Backfill existing rows
+        Payment.objects.update(hosted_billing=None)
+        call_command("backfill_hosted_billing", stdout=StringIO())
+        self.assertEqual(Payment.objects.filter(hosted_billing=42).count(), 2)
+        self.test_hosted()
+        subscription = Subscription.objects.get(service__hosted_billing=42)
+        self.assertEqual(subscription.payment, payments[1].pk)
+        self.assertEqual(
+            list(subscription.pastpayments_set.values_list("payment", flat=True)),
+            [payments[0].pk],
+        )
+
     def test_hosted_invalid(self):
         response = self.client.post("/api/hosted/", {"payload": dumps({}, key="dummy")})
         self.assertEqual(response.status_code, 400)
@@ -728,6 +1470,160 @@ class APITest(TestCase):
     def test_support_expired(self):
         self.test_support(delta=-1, expected="community")
 
+    def test_support_queue(self):
+        cache.clear()
+        Package.objects.create(name="community", verbose="Community support", price=0)
+        service = Service.objects.create(limit_projects=2)
+        service.update_status()
+        data = {"secret": service.secret, "site_url": "https://example.com/"}
+        for projects in (1, 1, 3):
+            # Answered from the cached status, the report is only queued
+            with self.assertNumQueries(1):
+                response = self.client.post(
+                    "/api/support/",
+                    dict(data, projects=projects),
+                    HTTP_USER_AGENT="weblate/1.2.3",
+                )
+            self.assertEqual(response.json()["in_limits"], projects <= 2)
+        response = self.client.post(
+            "/api/support/", dict(data, projects="x"), HTTP_USER_AGENT="weblate/1.2.3"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Report.objects.count(), 0)
+        self.assertEqual(QueuedReport.objects.count(), 3)
+        with patch("weblate_web.models.create_backup_repository") as backup:
+            call_command("flush_reports", stdout=StringIO())
+            backup.assert_not_called()
+        self.assertEqual(
+            list(service.report_set.values_list("projects", flat=True)), [1, 3]
+        )
+        self.assertEqual(QueuedReport.objects.count(), 0)
+        service.refresh_from_db()
+        self.assertEqual(service.last_report.projects, 3)
+
+    def test_provision_backups(self):
+        Package.objects.create(name="community", verbose="Community support", price=0)
+        service = Service.objects.create()
+        service.add_report(ssh_key="ssh-rsa key")
+        other = Service.objects.create()
+        other.add_report(ssh_key="ssh-rsa key")
+        for item, package in ((service, "backup"), (other, "extended")):
+            item.subscription_set.create(
+                package=package, expires=timezone.now() + timedelta(days=1)
+            )
+        with patch(
+            "weblate_web.models.create_backup_repository", return_value="repo"
+        ) as backup:
+            self.assertTrue(provision_backups())
+            backup.assert_called_once()
+        service.refresh_from_db()
+        self.assertEqual(service.backup_repository, "repo")
+
+    def test_last_report(self):
+        service = Service.objects.create()
+        first = service.add_report(site_url="https://example.com/", projects=1)
+        second = service.add_report(site_url="https://example.net/", projects=2)
+        self.assertEqual(Service.objects.get().last_report, second)
+        # Listing does not need queries per service
+        Service.objects.create().add_report(site_title="Other")
+        with self.assertNumQueries(1):
+            services = Service.objects.select_related("last_report").order_by("pk")
+            self.assertEqual(
+                [(item.site_url, item.projects_limit()) for item in services],
+                [("https://example.net/", "2"), ("", "0")],
+            )
+        # Removing latest report falls back to the previous one
+        second.delete()
+        self.assertEqual(Service.objects.get(pk=service.pk).last_report, first)
+        # Identical report is not stored again
+        service = Service.objects.get(pk=service.pk)
+        self.assertEqual(
+            service.add_report(site_url="https://example.com/", projects="1"), first
+        )
+        self.assertEqual(service.report_set.count(), 1)
+
+    def test_compact_reports(self):
+        service = Service.objects.create()
+        now = timezone.now()
+        month = (now - timedelta(days=400)).replace(day=1)
+        for timestamp, projects in (
+            (month, 1),
+            (month, 3),
+            (month + timedelta(days=1), 2),
+            (now - timedelta(days=40), 5),
+            (now - timedelta(days=40), 4),
+            (now, 6),
+        ):
+            report = service.add_report(projects=projects)
+            Report.objects.filter(pk=report.pk).update(timestamp=timestamp)
+        call_command("compact_reports", batch_size=2, stdout=StringIO())
+        # Latest report is kept
+        self.assertEqual(
+            list(service.report_set.values_list("projects", flat=True)), [6]
+        )
+        rollups = ReportRollup.objects.order_by("period", "start")
+        self.assertEqual(
+            [
+                (rollup.period, rollup.start, rollup.reports, rollup.projects)
+                for rollup in rollups
+            ],
+            [
+                ("d", (now - timedelta(days=40)).date(), 2, 5),
+                ("m", month.date(), 3, 3),
+            ],
+        )
+
+    def test_compact_reports_queries(self):
+        timestamp = timezone.now() - timedelta(days=400)
+        for count in (3, 50):
+            service = Service.objects.create()
+            for projects in range(count):
+                latest = service.add_report(projects=projects)
+            service.report_set.exclude(pk=latest.pk).update(timestamp=timestamp)
+            # Number of queries does not depend on the batch size
+            with self.assertNumQueries(6):
+                self.assertEqual(compact_reports(batch_size=200), count - 1)
+
+    def test_service_status(self):
+        Package.objects.create(name="community", verbose="Community support", price=0)
+        Package.objects.create(
+            name="shared:test", verbose="Test package", price=0, limit_projects=5
+        )
+        service = Service.objects.create()
+        now = timezone.now()
+        service.subscription_set.create(package="basic", expires=now + timedelta(1))
+        service.subscription_set.create(package="shared:test", expires=now)
+        service.subscription_set.create(
+            package="shared:test", expires=now + timedelta(days=30)
+        )
+        service = Service.objects.get(pk=service.pk)
+        # One grouped query for subscriptions and one for the package
+        with self.assertNumQueries(2):
+            service.update_status()
+            self.assertEqual(service.expires, now + timedelta(days=30))
+            self.assertEqual([name for name, _label in service.get_suggestions()], [])
+        self.assertEqual(service.status, "shared")
+        self.assertEqual(service.limit_projects, 5)
+        # Expired hosting falls back to the basic support
+        service.subscription_set.filter(package="shared:test").update(expires=now)
+        service.subscription_set.get(package="basic").save()
+        self.assertEqual(service.status, "basic")
+        self.assertEqual(service.limit_projects, 0)
+        # Removed subscription is reflected in the status snapshot
+        self.assertEqual(get_service_status(service.secret)["name"], "basic")
+        service.subscription_set.get(package="basic").delete()
+        self.assertEqual(get_service_status(service.secret)["name"], "community")
+        # Removed service is not answered from the snapshot
+        secret = service.secret
+        service.delete()
+        self.assertIsNone(get_service_status(secret))
+        service = Service.objects.create()
+        service.subscription_set.create(package="backup", expires=now)
+        self.assertEqual(
+            [name for name, _label in service.get_suggestions()],
+            ["basic", "premium", "extended"],
+        )
+
     def test_user(self):
         user = User.objects.create(username="testuser", password="testpassword")
         response = self.client.post(
@@ -25,7 +25,6 @@ from django.conf.urls.i18n import i18n_patterns
 from django.contrib import admin
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LogoutView
-from django.contrib.sitemaps import Sitemap
 from django.contrib.syndication.views import Feed
 from django.urls import path
 from django.utils import timezone
@@ -34,7 +33,9 @@ from django.views.generic import RedirectView, TemplateView
 from simple_sso.sso_client.client import Client
 
 from weblate_web.models import Post
+from weblate_web.sitemaps import SITEMAPS, pregenerated_sitemap
 from weblate_web.views import (
+    CachedTemplateView,
     CompleteView,
     CustomerView,
     DonateView,
@@ -44,6 +45,7 @@ from weblate_web.views import (
     NewsView,
     PaymentView,
     PostView,
+    SearchView,
     TopicArchiveView,
     activity_svg,
     api_hosted,
@@ -53,6 +55,7 @@ from weblate_web.views import (
     donate_pay,
     download_invoice,
     fetch_vat,
+    news_condition,
     not_found,
     process_payment,
     server_error,
@@ -90,56 +93,6 @@ class LatestEntriesFeed(Feed):
         return item.timestamp
 
 
-class PagesSitemap(Sitemap):
-    """Sitemap of static pages for one language."""
-
-    def __init__(self, language):
-        super().__init__()
-        self.language = language
-
-    def items(self):
-        return (
-            ("/", 1.0, "weekly"),
-            ("/features/", 0.9, "weekly"),
-            ("/download/", 0.5, "daily"),
-            ("/try/", 0.5, "weekly"),
-            ("/hosting/", 0.8, "monthly"),
-            ("/contribute/", 0.7, "monthly"),
-            ("/donate/", 0.7, "weekly"),
-            ("/careers/", 0.7, "weekly"),
-            ("/support/", 0.7, "monthly"),
-            ("/terms/", 0.2, "monthly"),
-            ("/news/", 0.9, "daily"),
-        )
-
-    def location(self, obj):
-        return "/{0}{1}".format(self.language, obj[0])
-
-    def priority(self, obj):
-        if self.language == "en":
-            return obj[1]
-        return obj[1] * 3 / 4
-
-    def changefreq(self, obj):
-        # pylint: disable=no-self-use
-        return obj[2]
-
-
-class NewsSitemap(Sitemap):
-    priority = 0.8
-
-    def items(self):
-        # pylint: disable=no-self-use
-        return Post.objects.filter(timestamp__lt=timezone.now()).order_by("-timestamp")
-
-    def lastmod(self, item):
-        # pylint: disable=no-self-use
-        return item.timestamp
-
-
-# create each section in all languages
-SITEMAPS = {lang[0]: PagesSitemap(lang[0]) for lang in settings.LANGUAGES}
-SITEMAPS["news"] = NewsSitemap()
 UUID = r"(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})"
 
 
@@ -149,29 +102,29 @@ SSO_CLIENT = Client(
 
 
 urlpatterns = i18n_patterns(
-    url(r"^$", TemplateView.as_view(template_name="index.html"), name="home"),
+    url(r"^$", CachedTemplateView.as_view(template_name="index.html"), name="home"),
     url(
         r"^features/$",
-        TemplateView.as_view(template_name="features.html"),
+        CachedTemplateView.as_view(template_name="features.html"),
         name="features",
     ),
     url(r"^tour/$", RedirectView.as_view(url="/hosting/", permanent=True)),
     url(
         r"^download/$",
-        TemplateView.as_view(template_name="download.html"),
+        CachedTemplateView.as_view(template_name="download.html"),
         name="download",
     ),
     url(r"^try/$", RedirectView.as_view(url="/hosting/", permanent=True)),
     url(
         r"^hosting/$",
-        TemplateView.as_view(template_name="hosting.html"),
+        CachedTemplateView.as_view(template_name="hosting.html"),
         name="hosting",
     ),
     url(r"^hosting/free/$", RedirectView.as_view(url="/hosting/", permanent=True)),
     url(r"^hosting/ordered/$", RedirectView.as_view(url="/hosting/", permanent=True)),
     url(
         r"^contribute/$",
-        TemplateView.as_view(template_name="contribute.html"),
+        CachedTemplateView.as_view(template_name="contribute.html"),
         name="contribute",
     ),
     url(
@@ -179,7 +132,11 @@ urlpatterns = i18n_patterns(
         login_required(TemplateView.as_view(template_name="user.html")),
         name="user",
     ),
-    url(r"^donate/$", TemplateView.as_view(template_name="donate.html"), name="donate"),
+    url(
+        r"^donate/$",
+        CachedTemplateView.as_view(template_name="donate.html"),
+        name="donate",
+    ),
     url(r"^donate/process/$", process_payment, name="donate-process"),
     url(r"^donate/new/$", DonateView.as_view(), name="donate-new"),
     url(r"^donate/edit/(?P<pk>[0-9]+)/$", EditLinkView.as_view(), name="donate-edit"),
@@ -204,6 +161,7 @@ urlpatterns = i18n_patterns(
     url(r"^subscription/new/$", subscription_new, name="subscription-new"),
     url(r"^news/$", NewsView.as_view(), name="news"),
     url(r"^news/archive/$", NewsArchiveView.as_view(), name="news-archive"),
+    url(r"^news/search/$", SearchView.as_view(), name="news-search"),
     url(
         r"^news/topic/milestone/$",
         MilestoneArchiveView.as_view(),
@@ -215,19 +173,27 @@ urlpatterns = i18n_patterns(
         name="topic-archive",
     ),
     url(r"^news/archive/(?P<slug>[-a-zA-Z0-9_]+)/$", PostView.as_view(), name="post"),
-    url(r"^about/$", TemplateView.as_view(template_name="about.html"), name="about"),
+    url(
+        r"^about/$",
+        CachedTemplateView.as_view(template_name="about.html"),
+        name="about",
+    ),
     url(
         r"^careers/$",
-        TemplateView.as_view(template_name="careers.html"),
+        CachedTemplateView.as_view(template_name="careers.html"),
         name="careers",
     ),
     url(
         r"^support/$",
-        TemplateView.as_view(template_name="support.html"),
+        CachedTemplateView.as_view(template_name="support.html"),
         name="support",
     ),
     url(r"^thanks/$", RedirectView.as_view(url="/donate/", permanent=True)),
-    url(r"^terms/$", TemplateView.as_view(template_name="terms.html"), name="terms"),
+    url(
+        r"^terms/$",
+        CachedTemplateView.as_view(template_name="terms.html"),
+        name="terms",
+    ),
     url(r"^payment/" + UUID + "/$", PaymentView.as_view(), name="payment"),
     url(
         r"^payment/" + UUID + "/edit/$", CustomerView.as_view(), name="payment-customer"
@@ -259,17 +225,23 @@ urlpatterns = i18n_patterns(
 ) + [
     url(
         r"^sitemap\.xml$",
-        cache_page(3600)(django.contrib.sitemaps.views.index),
+        news_condition(
+            pregenerated_sitemap(cache_page(3600)(django.contrib.sitemaps.views.index))
+        ),
         {"sitemaps": SITEMAPS, "sitemap_url_name": "sitemap"},
         name="sitemap-index",
     ),
     url(
         r"^sitemap-(?P<section>.+)\.xml$",
-        cache_page(1800)(django.contrib.sitemaps.views.sitemap),
+        news_condition(
+            pregenerated_sitemap(
+                cache_page(1800)(django.contrib.sitemaps.views.sitemap)
+            )
+        ),
         {"sitemaps": SITEMAPS},
         name="sitemap",
     ),
-    path("feed/", LatestEntriesFeed(), name="feed"),
+    path("feed/", news_condition(LatestEntriesFeed()), name="feed"),
     url(r"^js/vat/$", fetch_vat),
     url(r"^api/support/$", api_support),
     url(r"^api/user/$", api_user),
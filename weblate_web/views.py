@@ -17,13 +17,18 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
+from datetime import datetime, time, timedelta
+from hashlib import md5
+
 import django.views.defaults
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import SuspiciousOperation, ValidationError
 from django.core.mail import mail_admins, send_mail
+from django.core.paginator import Paginator
 from django.core.signing import BadSignature, SignatureExpired, loads
 from django.db import transaction
 from django.db.models import Q
@@ -31,11 +36,13 @@ from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonRespo
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
-from django.utils.translation import gettext, override
+from django.utils.translation import get_language, gettext, override
 from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
+from django.views.generic import TemplateView
 from django.views.generic.dates import ArchiveIndexView
 from django.views.generic.detail import DetailView, SingleObjectMixin
 from django.views.generic.edit import FormView, UpdateView
@@ -44,6 +51,8 @@ from payments.backends import get_backend, list_backends
 from payments.forms import CustomerForm
 from payments.models import Customer, Payment
 from payments.validators import cache_vies_data, validate_vatin
+from weblate_web.context_processors import replay_context
+from weblate_web.data import VERSION
 from weblate_web.forms import (
     DonateForm,
     EditImageForm,
@@ -53,17 +62,33 @@ from weblate_web.forms import (
     SubscribeForm,
 )
 from weblate_web.models import (
+    LIMIT_FIELDS,
+    NEWS_VERSION_TIMEOUT,
     PAYMENTS_ORIGIN,
+    REPORT_FIELDS,
     TOPIC_DICT,
     Donation,
     Package,
     Post,
+    Report,
     Service,
     Subscription,
+    get_news_version,
+    get_service_status,
+    is_in_limits,
     process_donation,
     process_subscription,
 )
-from weblate_web.remote import get_activity
+from weblate_web.pagecache import (
+    get_page_cache_key,
+    is_cacheable_request,
+    load_page,
+    store_page,
+)
+from weblate_web.related import get_related_posts
+from weblate_web.remote import get_activity_svg
+from weblate_web.reports import queue_report
+from weblate_web.search import SearchResults
 
 
 def get_customer(request):
@@ -137,31 +162,40 @@ def api_hosted(request):
     # Get/create service for this billing
     service = Service.objects.get_or_create(hosted_billing=payload["billing"])[0]
 
-    # TODO: This is temporary hack for payments migration period
-    payments = []
-    for payment in Payment.objects.order_by("end").iterator():
-        if payment.extra.get("billing", -1) == payload["billing"]:
-            payments.append(payment.pk)
+    payments = list(
+        Payment.objects.filter(hosted_billing=payload["billing"])
+        .order_by("end")
+        .values_list("pk", "end")
+    )
     if payments:
+        end = payments[-1][1]
+        payments = [payment for payment, _end in payments]
         # Create/update subscription
         subscription = Subscription.objects.get_or_create(
             service=service,
             package=payload["package"],
-            defaults={"payment": payments[-1]},
+            defaults={
+                "payment": payments[-1],
+                "expires": (
+                    timezone.make_aware(datetime.combine(end, time.max))
+                    if end
+                    else timezone.now()
+                ),
+            },
         )[0]
         if subscription.payment != payments[-1]:
             subscription.payment = payments[-1]
             subscription.save(update_fields=["payment"])
         # Link past payments
         for payment in payments[:-1]:
-            subscription.pastpayment_set.get_or_create(payment=payment)
+            subscription.pastpayments_set.get_or_create(payment=payment)
 
     # Link users which are supposed to have access
     for user in payload["users"]:
         service.users.add(User.objects.get_or_create(username=user)[0])
 
     # Collect stats
-    service.report_set.create(
+    service.add_report(
         site_url="https://hosted.weblate.org/",
         site_title="Hosted Weblate",
         projects=payload["projects"],
@@ -184,8 +218,10 @@ def api_hosted(request):
 @require_POST
 @csrf_exempt
 def api_support(request):
-    service = get_object_or_404(Service, secret=request.POST.get("secret", ""))
-    service.report_set.create(
+    status = get_service_status(request.POST.get("secret", ""))
+    if status is None:
+        raise Http404("Invalid secret")
+    report = Report(
         site_url=request.POST.get("site_url", ""),
         site_title=request.POST.get("site_title", ""),
         ssh_key=request.POST.get("ssh_key", ""),
@@ -196,14 +232,21 @@ def api_support(request):
         source_strings=request.POST.get("source_strings", 0),
         version=request.headers["User-Agent"].split("/", 1)[1],
     )
-    service.update_status()
-    service.create_backup()
+    try:
+        report.normalize()
+    except ValidationError as error:
+        return HttpResponseBadRequest(str(error))
+    # Stored in the background by flush_reports
+    queue_report(status["pk"], {name: getattr(report, name) for name in REPORT_FIELDS})
     return JsonResponse(
         data={
-            "name": service.status,
-            "expiry": service.expires,
-            "backup_repository": service.backup_repository,
-            "in_limits": service.check_in_limits(),
+            "name": status["name"],
+            "expiry": status["expiry"],
+            "backup_repository": status["backup_repository"],
+            "in_limits": is_in_limits(
+                status["limits"],
+                {name: getattr(report, name) for name in LIMIT_FIELDS},
+            ),
         }
     )
 
@@ -511,11 +554,166 @@ def subscribe(request, name):
     return redirect("support")
 
 
+class CachedTemplateView(TemplateView):
+    """Template view with full page caching for anonymous users."""
+
+    # Query parameters changing the page content
+    cache_query_params = ()
+
+    def get(self, request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            return super().get(request, *args, **kwargs)
+        key = get_page_cache_key(request, self.cache_query_params)
+        cached = cache.get(key)
+        if cached is not None:
+            replay_context(request, cached["context"])
+            return load_page(cached)
+        response = super().get(request, *args, **kwargs)
+        response.add_post_render_callback(
+            lambda response: store_page(request, key, response)
+        )
+        return response
+
+
+def news_etag(request, *args, **kwargs):
+    """ETag for news pages, it does not need any database query."""
+    return md5(
+        ":".join(
+            (
+                get_news_version()["tag"],
+                VERSION,
+                get_language(),
+                request.get_full_path(),
+                str(request.user.pk),
+            )
+        ).encode()
+    ).hexdigest()
+
+
+def news_last_modified(request, *args, **kwargs):
+    return get_news_version()["last_modified"]
+
+
+news_condition = condition(etag_func=news_etag, last_modified_func=news_last_modified)
+
+
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(post):
+    """Encode position of a post in the archive."""
+    return "{}-{}".format(
+        (post.timestamp - CURSOR_EPOCH) // timedelta(microseconds=1), post.pk
+    )
+
+
+def decode_cursor(value):
+    try:
+        timestamp, pk = value.split("-")
+        return CURSOR_EPOCH + timedelta(microseconds=int(timestamp)), int(pk)
+    except (ValueError, OverflowError):
+        raise Http404("Invalid cursor")
+
+
+class KeysetPage:
+    """Archive page positioned by cursor instead of page number."""
+
+    def __init__(self, object_list, count, newer=None, older=None):
+        self.object_list = object_list
+        self.count = count
+        self.newer = newer
+        self.older = older
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return bool(self.newer or self.older)
+
+
+@method_decorator(news_condition, name="dispatch")
 class NewsArchiveView(ArchiveIndexView):
+    """News archive with keyset pagination.
+
+    Pages are positioned by (timestamp, pk) of the neighbouring post, so
+    every page costs a single indexed query. Total count and date list
+    are cached until the news version changes.
+    """
+
     model = Post
     date_field = "timestamp"
     paginate_by = 10
-    ordering = ("-timestamp",)
+    ordering = ("-timestamp", "-pk")
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("image")
+
+    def get_dated_queryset(self, **lookup):
+        # Emptiness is checked by get_date_list using the cached value
+        return self.get_queryset().filter(timestamp__lte=timezone.now(), **lookup)
+
+    def get_cached(self, name, func):
+        key = "wlweb-news-{}-{}".format(
+            name,
+            md5(
+                ":".join(
+                    (
+                        get_news_version()["tag"],
+                        self.__class__.__name__,
+                        repr(sorted(self.kwargs.items())),
+                    )
+                ).encode()
+            ).hexdigest(),
+        )
+        result = cache.get(key)
+        if result is None:
+            result = func()
+            cache.set(key, result, NEWS_VERSION_TIMEOUT)
+        return result
+
+    def get_date_list(self, queryset, date_type=None, ordering="ASC"):
+        return self.get_cached(
+            "dates-{}-{}".format(date_type, ordering),
+            lambda: list(
+                super(NewsArchiveView, self).get_date_list(
+                    queryset, date_type, ordering
+                )
+            ),
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        count = self.get_cached("count", queryset.count)
+        after = self.request.GET.get("after")
+        before = self.request.GET.get("before")
+        if after:
+            timestamp, pk = decode_cursor(after)
+            queryset = queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk)
+            ).order_by("timestamp", "pk")
+            object_list = list(queryset[: page_size + 1])
+            has_newer = len(object_list) > page_size
+            has_older = True
+            object_list = object_list[:page_size][::-1]
+        else:
+            if before:
+                timestamp, pk = decode_cursor(before)
+                queryset = queryset.filter(
+                    Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk)
+                )
+            object_list = list(queryset.order_by("-timestamp", "-pk")[: page_size + 1])
+            has_newer = bool(before)
+            has_older = len(object_list) > page_size
+            object_list = object_list[:page_size]
+        page = KeysetPage(object_list, count)
+        if object_list:
+            if has_newer:
+                page.newer = encode_cursor(object_list[0])
+            if has_older:
+                page.older = encode_cursor(object_list[-1])
+        return (None, page, object_list, page.has_other_pages())
 
 
 class NewsView(NewsArchiveView):
@@ -545,6 +743,7 @@ class MilestoneArchiveView(NewsArchiveView):
         return result
 
 
+@method_decorator(news_condition, name="dispatch")
 class PostView(DetailView):
     model = Post
 
@@ -555,14 +754,53 @@ class PostView(DetailView):
         return result
 
     def get_context_data(self, **kwargs):
-        kwargs["related"] = (
-            Post.objects.filter(topic=self.object.topic)
-            .exclude(pk=self.object.pk)
-            .order_by("-timestamp")[:3]
-        )
+        kwargs["related"] = get_related_posts(self.object, timezone.now())
         return kwargs
 
 
+def get_elided_page_range(page, on_each_side=3, on_ends=2):
+    """Return page numbers to link from the page, None marks a gap.
+
+    Same as Paginator.get_elided_page_range available in Django 3.2.
+    """
+    num_pages = page.paginator.num_pages
+    number = page.number
+    if num_pages <= (on_each_side + on_ends) * 2:
+        return list(page.paginator.page_range)
+    result = []
+    if number > 1 + on_each_side + on_ends + 1:
+        result.extend(range(1, on_ends + 1))
+        result.append(None)
+        result.extend(range(number - on_each_side, number + 1))
+    else:
+        result.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends - 1:
+        result.extend(range(number + 1, number + on_each_side + 1))
+        result.append(None)
+        result.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        result.extend(range(number + 1, num_pages + 1))
+    return result
+
+
+class SearchView(TemplateView):
+    template_name = "weblate_web/post_search.html"
+    paginate_by = 10
+
+    def get_context_data(self, **kwargs):
+        result = super().get_context_data(**kwargs)
+        query = self.request.GET.get("q", "").strip()
+        result["query"] = query
+        if query:
+            paginator = Paginator(
+                SearchResults(query, timezone.now()), self.paginate_by
+            )
+            result["page_obj"] = page = paginator.get_page(self.request.GET.get("page"))
+            result["object_list"] = page.object_list
+            result["page_range"] = get_elided_page_range(page)
+        return result
+
+
 # pylint: disable=unused-argument
 def not_found(request, exception=None):
     """Error handler showing list of available projects."""
@@ -580,37 +818,14 @@ def server_error(request):
 
 @cache_control(max_age=3600)
 def activity_svg(request):
-    bars = []
-    opacities = {0: ".1", 1: ".3", 2: ".5", 3: ".7"}
-    data = get_activity()
-    top_count = max(data) if data else 0
-    for i, count in enumerate(data):
-        height = int(76 * count / top_count)
-        item = {
-            "rx": 2,
-            "width": 6,
-            "height": height,
-            "id": "b{}".format(i),
-            "x": 10 * i,
-            "y": 86 - height,
-        }
-        if height < 20:
-            item["fill"] = "#f6664c"
-        elif height < 45:
-            item["fill"] = "#38f"
-        else:
-            item["fill"] = "#2eccaa"
-        if i in opacities:
-            item["opacity"] = opacities[i]
-
-        bars.append(item)
-
-    return render(
-        request,
-        "svg/activity.svg",
-        {"bars": bars},
-        content_type="image/svg+xml; charset=utf-8",
-    )
+    svg = get_activity_svg()
+    response = get_conditional_response(request, etag=svg["etag"])
+    if response is None:
+        response = HttpResponse(
+            svg["content"], content_type="image/svg+xml; charset=utf-8"
+        )
+    response["ETag"] = svg["etag"]
+    return response
 
 
 @require_POST